@@ -0,0 +1,64 @@
+"""Benchmarks the memory and slicing time of preprocessed corpora.
+
+Compares the tuple returned by `preprocess_documents` (lists of tokens and bag of words) with `RaggedCorpus`.
+Memory is the size of the Python allocations held by the result, measured with `tracemalloc`.
+
+Usage (from project root):
+    python -m benchmarks.corpus --num-docs 200000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from benchmarks.documents import _iter_chunks
+from benchmarks.tokenize import KEYWORDS
+from src.corpus import documents
+from src.preprocessing.corpus import RaggedCorpus
+from src.preprocessing.documents import preprocess_documents
+
+SLICE_SIZE = 1000
+
+
+def _measure(func):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, size / 1024 / 1024
+
+
+def _time_slices(get_slice, num_docs, repeat=200):
+    start = time.perf_counter()
+    for i in range(repeat):
+        offset = (i * SLICE_SIZE) % max(num_docs - SLICE_SIZE, 1)
+        get_slice(offset, offset + SLICE_SIZE)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-docs', type=int, default=200000)
+    args = parser.parse_args()
+    if documents.keywords is None:
+        documents.keywords = KEYWORDS
+    docs = []
+    for texts in _iter_chunks(args.num_docs):
+        docs.extend(documents.CorpusDocument.create_many(texts, authors=[j % 100 for j in range(len(texts))]))
+    data, tuple_seconds, tuple_mb = _measure(lambda: preprocess_documents(docs))
+    ragged, ragged_seconds, ragged_mb = _measure(lambda: RaggedCorpus.from_documents(docs))
+    corpus, _, tokenized_docs, _, _ = data
+    assert list(ragged.to_tuple()[0]) == corpus, 'bag of words do not match.'
+    tuple_slice_ms = _time_slices(lambda start, stop: (corpus[start:stop], tokenized_docs[start:stop]), len(docs))
+    ragged_slice_ms = _time_slices(lambda start, stop: ragged[start:stop], len(docs))
+    print('{:<8} {:>10} {:>10} {:>16}'.format('corpus', 'seconds', 'MB', 'slice ms/1k docs'))
+    print('{:<8} {:>10.2f} {:>10.1f} {:>16.3f}'.format('tuple', tuple_seconds, tuple_mb, tuple_slice_ms))
+    print('{:<8} {:>10.2f} {:>10.1f} {:>16.3f}'.format('ragged', ragged_seconds, ragged_mb, ragged_slice_ms))
+
+
+if __name__ == '__main__':
+    main()
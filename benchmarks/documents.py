@@ -0,0 +1,84 @@
+"""Benchmarks memory use of documents held in memory.
+
+Compares `CorpusDocument` with `LazyCorpusDocument` before tokenization, after tokenization and after
+  dropping the text. Texts are generated in chunks so that they are only referenced by the documents.
+Each mode runs in its own process and reports the growth of the resident set size while creating documents.
+
+Usage (from project root):
+    python -m benchmarks.documents --num-docs 1000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.tokenize import KEYWORDS, PIECES
+from src.corpus import documents
+
+MODES = ['corpus-document', 'lazy', 'lazy-tokenized', 'lazy-dropped']
+
+CHUNK_SIZE = 10000
+
+
+def _rss_mb():
+    with open('/proc/self/statm') as fp:
+        pages = int(fp.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def _iter_chunks(num_docs, seed=42):
+    rng = np.random.default_rng(seed)
+    # zipf-like vocabulary so that documents share most of their tokens
+    vocab = np.array(PIECES + ['word{}'.format(i) for i in range(20000)], dtype=object)
+    proba = 1.0 / np.arange(1, len(vocab) + 1)
+    proba /= proba.sum()
+    for start in range(0, num_docs, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, num_docs - start)
+        words = vocab[rng.choice(len(vocab), size=(size, 30), p=proba)].tolist()
+        lengths = rng.integers(5, 31, size=size).tolist()
+        yield [' '.join(doc_words[:length]) for doc_words, length in zip(words, lengths)]
+
+
+def _run(mode, num_docs):
+    if documents.keywords is None:
+        documents.keywords = KEYWORDS
+    documents._get_keyword_processor()
+    base_rss = _rss_mb()
+    start = time.perf_counter()
+    docs = []
+    for texts in _iter_chunks(num_docs):
+        if mode == 'corpus-document':
+            docs.extend(documents.CorpusDocument.create_many(texts))
+        elif mode == 'lazy':
+            docs.extend(documents.LazyCorpusDocument(text) for text in texts)
+        elif mode == 'lazy-tokenized':
+            docs.extend(documents.LazyCorpusDocument.create_many(texts))
+        else:
+            docs.extend(doc.drop_text() for doc in documents.LazyCorpusDocument.create_many(texts))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'mode': mode, 'docs': len(docs), 'seconds': elapsed, 'rss_mb': _rss_mb() - base_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-docs', type=int, default=1000000)
+    parser.add_argument('--run', choices=MODES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run is not None:
+        return _run(args.run, args.num_docs)
+    print('{:<16} {:>10} {:>10} {:>10} {:>14}'.format('mode', 'docs', 'seconds', 'RSS MB', 'bytes/doc'))
+    for mode in MODES:
+        cmd = [sys.executable, '-m', 'benchmarks.documents', '--run', mode, '--num-docs', str(args.num_docs)]
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().split('\n')[-1])
+        print('{:<16} {:>10} {:>10.2f} {:>10.1f} {:>14.0f}'.format(
+            mode, result['docs'], result['seconds'], result['rss_mb'],
+            result['rss_mb'] * 1024 * 1024 / result['docs']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Benchmarks document-topic inference of `AuthorTopicModel.transform`.
+
+Compares the batched transform with the previous per-document inference (one `get_new_author_topics` call
+  per document). Both start from the same random state, topic probabilities of the documents inferred by
+  both are checked to match before reporting throughput in documents per second.
+
+Usage (from project root):
+    python -m benchmarks.inference --num-docs 100000 --num-legacy-docs 2000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.documents import _iter_chunks
+from benchmarks.tokenize import KEYWORDS
+from src.corpus import documents
+from src.models.author_topic_model import AuthorTopicModel
+from src.preprocessing.documents import preprocess_documents
+
+
+def _legacy_transform(model, corpus):
+    output = []
+    for i in range(len(corpus)):
+        topic_proba = model._base_model.get_new_author_topics(corpus[i:i + 1], minimum_probability=0)
+        output.append(list(zip(*topic_proba))[1])
+    return np.array(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-docs', type=int, default=100000)
+    parser.add_argument('--num-legacy-docs', type=int, default=2000)
+    parser.add_argument('--num-topics', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    args = parser.parse_args()
+    if documents.keywords is None:
+        documents.keywords = KEYWORDS
+    docs = []
+    for texts in _iter_chunks(args.num_docs):
+        docs.extend(documents.CorpusDocument.create_many(texts, authors=[j % 100 for j in range(len(texts))]))
+    data = preprocess_documents(docs, return_type='sparse')
+    model = AuthorTopicModel(num_topics=args.num_topics, iterations=args.iterations, callbacks=[])
+    model.fit(data)
+    corpus = data[0]
+    random_state = model._base_model.random_state
+    state = random_state.get_state()
+    start = time.perf_counter()
+    legacy = _legacy_transform(model, corpus[:args.num_legacy_docs])
+    legacy_seconds = time.perf_counter() - start
+    random_state.set_state(state)
+    start = time.perf_counter()
+    batched = model.transform(data, batch_size=args.batch_size)
+    batched_seconds = time.perf_counter() - start
+    max_error = np.abs(batched[:len(legacy)] - legacy).max()
+    assert max_error < 1e-6, 'topic probabilities do not match: {}'.format(max_error)
+    print('{:<10} {:>10} {:>10} {:>12}'.format('transform', 'docs', 'seconds', 'docs/sec'))
+    print('{:<10} {:>10} {:>10.2f} {:>12.0f}'.format('legacy', len(legacy), legacy_seconds,
+                                                    len(legacy) / legacy_seconds))
+    print('{:<10} {:>10} {:>10.2f} {:>12.0f}'.format('batched', len(batched), batched_seconds,
+                                                    len(batched) / batched_seconds))
+    print('max abs difference: {:.2e}'.format(max_error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Benchmarks reading a large synthetic jsonline file.
+
+Compares the previous whole-file reader with the streaming reader in `src.utils.jsonline`, on the plain
+  file and on a block-compressed gzip copy of it.
+Each mode runs in its own process so that the reported peak RSS is not shared between modes.
+
+Usage (from project root):
+    python -m benchmarks.jsonline --num-records 500000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.utils import jsonline
+
+MODES = ['legacy', 'stream', 'stream-auto', 'gzip-auto']
+
+
+def _legacy_load(path):
+    with open(path) as fp:
+        for line in fp.read().strip().split('\n'):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            yield json.loads(line)
+
+
+def _generate(path, num_records, seed=42):
+    rnd = random.Random(seed)
+    words = ['climate', 'weather', 'storm', 'heat', 'rain', 'forecast', 'today', 'flood', 'drought', 'wind']
+    with open(path, 'w', encoding='utf-8') as fp:
+        for i in range(num_records):
+            tweet = {
+                'id': str(10 ** 18 + i),
+                'text': ' '.join(rnd.choice(words) for _ in range(rnd.randint(5, 40))),
+                'created_at': '2020-{:02}-{:02}T12:00:00.000Z'.format(rnd.randint(1, 12), rnd.randint(1, 28)),
+                'lang': rnd.choice(['en', 'en', 'en', 'es']),
+                'public_metrics': {'retweet_count': rnd.randint(0, 100), 'like_count': rnd.randint(0, 1000)},
+            }
+            fp.write(json.dumps(tweet))
+            fp.write('\n')
+
+
+def _run(mode, path):
+    start = time.perf_counter()
+    if mode == 'legacy':
+        records = _legacy_load(path)
+    elif mode == 'stream':
+        records = jsonline.load(path, decoder='json')
+    else:
+        records = jsonline.load(path, decoder='auto')
+    count = sum(1 for _ in records)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'mode': mode, 'records': count, 'seconds': elapsed, 'peak_rss_mb': peak_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-records', type=int, default=500000)
+    parser.add_argument('--path', default=None, help='existing jsonline file to benchmark.')
+    parser.add_argument('--run', choices=MODES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run is not None:
+        return _run(args.run, args.path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp_dir, 'tweets.jsonl')
+            _generate(path, args.num_records)
+        gz_path = jsonline.compress(path, output_path=os.path.join(tmp_dir, 'tweets.jsonl.gz'))
+        for fp in (path, gz_path):
+            print('file: {} ({:.1f} MB)'.format(fp, os.path.getsize(fp) / 1024 / 1024))
+        print('{:<12} {:>10} {:>10} {:>14} {:>12}'.format('mode', 'records', 'seconds', 'records/sec', 'peak RSS MB'))
+        for mode in MODES:
+            mode_path = gz_path if mode.startswith('gzip') else path
+            cmd = [sys.executable, '-m', 'benchmarks.jsonline', '--run', mode, '--path', mode_path]
+            output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().split('\n')[-1])
+            print('{:<12} {:>10} {:>10.2f} {:>14.0f} {:>12.1f}'.format(
+                mode, result['records'], result['seconds'],
+                result['records'] / result['seconds'], result['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    main()
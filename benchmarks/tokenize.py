@@ -0,0 +1,93 @@
+"""Benchmarks the batch tokenizer against the per-document gensim filter chain.
+
+Tokens of both paths are checked to be identical before timing.
+
+Usage (from project root):
+    python -m benchmarks.tokenize --num-docs 100000
+"""
+import argparse
+import random
+import time
+
+from flashtext import KeywordProcessor
+from gensim.parsing import preprocessing as gpp
+
+from src.corpus import documents
+
+KEYWORDS = {
+    'climate': ['climate change', 'global warming', 'carbon'],
+    'weather': ['storm', 'heat wave', 'flood'],
+}
+
+PIECES = [
+    'Climate', 'change', 'is', 'REAL', 'storm', 'heat wave', 'the', 'and', 'flooding', 'Global Warming', 'carbon',
+    '#ClimateAction', '#wx', '@NWS', '@user_1', 'https://t.co/AbC123', 'http://example.com/a?b=1',
+    'xhttps://foo', '<b>bold</b>', '2021', '3pm', 'co2', '...', '!!', "it's", 'é', 'naïve', '#tag@user',
+    '#tag.https://t.co/x', 'wordhttp.#tag.more', '<i', 'a<b', '>', '&amp;', '\n', '\t',
+]
+
+
+def _legacy_tokenize(text):
+    hashtags = documents.HASHTAG_PATTERN.findall(text)
+    return gpp.preprocess_string(text, filters=[
+        gpp.lower_to_unicode,
+        lambda x: documents.URL_PATTERN.sub(' ', x),
+        lambda x: documents.HASHTAG_PATTERN.sub(' ', x),
+        lambda x: documents.MENTION_PATTERN.sub(' ', x),
+        lambda x: documents.URL_PATTERN_2.sub(' ', x),
+        gpp.strip_tags,
+        gpp.strip_punctuation,
+        gpp.strip_numeric,
+        lambda x: x + ' '.join(hashtags),
+        gpp.remove_stopwords,
+        gpp.strip_short,
+        gpp.strip_multiple_whitespaces,
+    ])
+
+
+def _generate(num_docs, seed=42):
+    rnd = random.Random(seed)
+    texts = []
+    for _ in range(num_docs):
+        parts = [rnd.choice(PIECES) for _ in range(rnd.randint(5, 30))]
+        texts.append(''.join(p + rnd.choice([' ', ' ', ' ', '', ', ']) for p in parts))
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-docs', type=int, default=100000)
+    args = parser.parse_args()
+    if documents.keywords is None:
+        documents.keywords = KEYWORDS
+    texts = _generate(args.num_docs)
+    keyword_processor = KeywordProcessor(case_sensitive=False)
+    keyword_processor.add_keywords_from_dict(documents.keywords)
+    start = time.perf_counter()
+    legacy = [(_legacy_tokenize(text), keyword_processor.extract_keywords(text)) for text in texts]
+    legacy_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    legacy_tokens = [_legacy_tokenize(text) for text in texts]
+    legacy_tokens_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    batch_tokens = documents.tokenize_many(texts)
+    batch_tokens_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = [(tokens, doc_keywords) for tokens, _, doc_keywords in
+             documents.tokenize_many(texts, return_keywords=True)]
+    batch_seconds = time.perf_counter() - start
+    assert legacy == batch, 'batch tokens do not match the per-document filter chain.'
+    assert legacy_tokens == batch_tokens, 'batch tokens do not match the per-document filter chain.'
+    rows = [
+        ('per-document', 'tokens', legacy_tokens_seconds),
+        ('tokenize_many', 'tokens', batch_tokens_seconds),
+        ('per-document', 'tokens+keywords', legacy_seconds),
+        ('tokenize_many', 'tokens+keywords', batch_seconds),
+    ]
+    print('{:<14} {:<16} {:>10} {:>14}'.format('path', 'output', 'seconds', 'docs/sec'))
+    for name, output, seconds in rows:
+        print('{:<14} {:<16} {:>10.2f} {:>14.0f}'.format(name, output, seconds, len(texts) / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,22 @@
 """Corpus related functions."""
-from src.corpus.keywords import load_keywords, keywords
-from src.corpus.twitter import load_tweets, load_availability
+from src.corpus.keywords import load_keywords, keywords, load_keyword_processor, get_keyword_matrix
+from src.corpus.twitter import load_tweets, load_availability, load_lang_counts
+from src.corpus.store import ingest_tweets
+from src.corpus.catalog import AvailabilityCatalog
+from src.corpus.tweet_index import get_tweets, build_tweet_index
+from src.corpus.token_cache import TokenCache
 
 __all__ = [
     'load_tweets',
     'load_availability',
+    'load_lang_counts',
+    'ingest_tweets',
+    'AvailabilityCatalog',
+    'get_tweets',
+    'build_tweet_index',
+    'TokenCache',
     'load_keywords',
     'keywords',
+    'load_keyword_processor',
+    'get_keyword_matrix',
 ]
@@ -0,0 +1,225 @@
+"""Persistent catalog of the timeline files available in the raw tweets directory.
+
+The catalog is a sqlite database with one row per timeline file holding
+  (twitter, year, month, size, num_lines, mtime). Refreshing the catalog only rescans the
+  directories of users whose mtime has changed since the last refresh, and queries are answered from
+  the database without touching the filesystem.
+
+Timeline files may be compressed (see `src.utils.jsonline`), sizes are the sizes of the files on disk.
+
+Note: the mtime of a directory changes only when files are added, removed or renamed in it. Use
+  `refresh(full=True)` after rewriting existing month files in place.
+"""
+import os
+import sqlite3
+
+import tqdm
+
+from src.config import config
+from src.utils import jsonline
+
+__all__ = [
+    'AvailabilityCatalog',
+    'get_catalog_path',
+    'count_lines',
+]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS directories (twitter TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    twitter TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    num_lines INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (twitter, year, month)
+);
+CREATE INDEX IF NOT EXISTS files_period_idx ON files (period);
+'''
+
+_FILE_COLUMNS = ('twitter', 'year', 'month', 'size', 'num_lines', 'mtime_ns')
+
+
+def get_catalog_path(catalog_path=None):
+    """Gets path to the catalog database.
+
+    :param catalog_path: path to the catalog, defaults to `data/interim/tweets_catalog.sqlite` in project path.
+    :return: path to the catalog.
+    """
+    if catalog_path is None:
+        catalog_path = os.path.join(config['DEFAULT']['project_path'], 'data', 'interim', 'tweets_catalog.sqlite')
+    return catalog_path
+
+
+def count_lines(path, buffer_size=1024 * 1024):
+    """Counts non-terminated and newline terminated lines of a file with bounded memory.
+
+    Compressed jsonline files are counted on their decompressed content.
+
+    :param path: path to the file.
+    :param buffer_size: size of the read buffer in bytes.
+    :return: number of lines.
+    """
+    num_lines, last = 0, b'\n'
+    with jsonline.open_file(path, buffer_size=buffer_size) as fp:
+        for block in iter(lambda: fp.read(buffer_size), b''):
+            num_lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        num_lines += 1
+    return num_lines
+
+
+def _parse_filename(fn):
+    fn, ext = jsonline.split_extension(fn)
+    if (ext is None) or (ext.split('.')[1] != 'jsonl'):
+        return None
+    year, month = fn.split('-')
+    assert len(year) == 4, 'Year must be represented with four digits.'
+    assert len(month) == 2, 'Month must be represented with two digits with leading zeros if required.'
+    return int(year), int(month)
+
+
+def _get_compression_rank(fn):
+    # order of preference of the compression of the file, see `jsonline.find_file`
+    _, ext = jsonline.split_extension(fn)
+    return jsonline.COMPRESSION_EXTENSIONS.index(ext[len('.jsonl'):])
+
+
+def _to_period(value):
+    if value is None:
+        return None
+    if hasattr(value, 'month'):
+        return value.year * 12 + value.month - 1
+    year, month = value
+    return year * 12 + month - 1
+
+
+class AvailabilityCatalog(object):
+    """On-disk catalog of available timeline files."""
+
+    def __init__(self, path=None, catalog_path=None):
+        """Opens (or creates) the catalog for the provided tweets directory.
+
+        :param path: path to the root directory containing tweets.
+        :param catalog_path: path to the catalog database.
+        """
+        if path is None:
+            path = os.path.join(config['DEFAULT']['project_path'], 'data', 'raw', 'tweets')
+        self.path = os.path.abspath(path)
+        self.catalog_path = get_catalog_path(catalog_path)
+        catalog_dir = os.path.dirname(os.path.abspath(self.catalog_path))
+        if not os.path.exists(catalog_dir):
+            os.makedirs(catalog_dir)
+        self._conn = sqlite3.connect(self.catalog_path)
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', ('path',)).fetchone()
+        if (row is not None) and (row[0] != self.path):
+            # catalog was built for a different tweets directory
+            self._conn.execute('DELETE FROM directories')
+            self._conn.execute('DELETE FROM files')
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('path', self.path))
+        self._conn.commit()
+
+    def close(self):
+        """Closes connection to the catalog database.
+
+        :return: None.
+        """
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _scan_directory(self, twitter, full=False):
+        timeline_path = os.path.join(self.path, twitter)
+        known = {
+            (year, month): (size, mtime_ns)
+            for year, month, size, mtime_ns in self._conn.execute(
+                'SELECT year, month, size, mtime_ns FROM files WHERE twitter = ?', (twitter,))
+        }
+        # a month may be stored both compressed and uncompressed, keep the file `jsonline.find_file` reads
+        entries = {}
+        for entry in os.scandir(timeline_path):
+            key = _parse_filename(str(entry.name))
+            if key is None:
+                continue
+            if (key not in entries) or (_get_compression_rank(entry.name) < _get_compression_rank(entries[key].name)):
+                entries[key] = entry
+        seen = set(entries)
+        for key, entry in entries.items():
+            stat = entry.stat()
+            if (not full) and (known.get(key) == (stat.st_size, stat.st_mtime_ns)):
+                continue
+            year, month = key
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (twitter, year, month, period, size, num_lines, mtime_ns) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (twitter, year, month, _to_period(key), stat.st_size, count_lines(entry.path), stat.st_mtime_ns)
+            )
+        for year, month in set(known) - seen:
+            self._conn.execute('DELETE FROM files WHERE twitter = ? AND year = ? AND month = ?',
+                               (twitter, year, month))
+
+    def refresh(self, full=False, verbose=False):
+        """Updates the catalog from the filesystem.
+
+        Only directories whose mtime changed since the last refresh are rescanned unless `full` is set.
+
+        :param full: whether to rescan all directories and files.
+        :param verbose: whether to show progress bar.
+        :return: number of directories rescanned.
+        """
+        known = dict(self._conn.execute('SELECT twitter, mtime_ns FROM directories'))
+        entries = [entry for entry in os.scandir(self.path) if entry.is_dir()]
+        if verbose:
+            entries = tqdm.tqdm(entries, desc='Refreshing Availability')
+        seen, num_scanned = set(), 0
+        for entry in entries:
+            twitter = str(entry.name)
+            seen.add(twitter)
+            mtime_ns = entry.stat().st_mtime_ns
+            if (not full) and (known.get(twitter) == mtime_ns):
+                continue
+            self._scan_directory(twitter, full=full)
+            self._conn.execute('INSERT OR REPLACE INTO directories (twitter, mtime_ns) VALUES (?, ?)',
+                               (twitter, mtime_ns))
+            num_scanned += 1
+        for twitter in set(known) - seen:
+            self._conn.execute('DELETE FROM directories WHERE twitter = ?', (twitter,))
+            self._conn.execute('DELETE FROM files WHERE twitter = ?', (twitter,))
+        self._conn.commit()
+        return num_scanned
+
+    def query(self, twitter=None, start=None, end=None):
+        """Gets the timeline files in the catalog without touching the filesystem.
+
+        :param twitter: twitter handle or a list of handles to include. Defaults to all handles.
+        :param start: first month (inclusive) as a date or (year, month) tuple.
+        :param end: last month (inclusive) as a date or (year, month) tuple.
+        :return: list of dict with keys ['twitter', 'year', 'month', 'size', 'num_lines', 'mtime_ns'].
+        """
+        conditions, params = [], []
+        if twitter is not None:
+            if isinstance(twitter, str):
+                twitter = [twitter]
+            twitter = list(twitter)
+            conditions.append('twitter IN ({})'.format(', '.join('?' for _ in twitter)))
+            params += twitter
+        if start is not None:
+            conditions.append('period >= ?')
+            params.append(_to_period(start))
+        if end is not None:
+            conditions.append('period <= ?')
+            params.append(_to_period(end))
+        sql = 'SELECT {} FROM files'.format(', '.join(_FILE_COLUMNS))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY twitter, period'
+        return [dict(zip(_FILE_COLUMNS, row)) for row in self._conn.execute(sql, params)]
@@ -1,46 +1,147 @@
 """Convert tweets to documents for training and testing Topic Models."""
-import json
+import functools
 import os
 import re
+import string
+import sys
 
 import tqdm
-from flashtext import KeywordProcessor
 from gensim.parsing import preprocessing as gpp
 
 from src.config import config
 from src.corpus import keywords
+from src.corpus.keywords import load_keyword_processor
+from src.utils import jsonline, parallel
+
+__all__ = [
+    'CorpusDocument',
+    'LazyCorpusDocument',
+    'load_documents',
+    'tokenize',
+    'tokenize_many',
+]
+
+# version of the tokenizer, increment when changing `tokenize` to invalidate cached tokens
+TOKENIZER_VERSION = 1
+
+URL_PATTERN = re.compile('http[s]?://\S+')
+URL_PATTERN_2 = re.compile('\Bhttp[s]?\S+')
+HASHTAG_PATTERN = re.compile('\B\#[a-zA-Z0-9_]+')
+MENTION_PATTERN = re.compile('\B\@[a-zA-Z0-9_]+')
+# hashtags and mentions in one pass, a mention right after a hashtag is removed as it would be once the hashtag
+# is replaced by a space when the patterns are applied one after the other
+SOCIAL_PATTERN = re.compile('\B\#[a-zA-Z0-9_]+(?:\@[a-zA-Z0-9_]+)?|\B\@[a-zA-Z0-9_]+')
+TAG_PATTERN = re.compile('<([^>]+)>')
+# `gpp.strip_punctuation` and `gpp.strip_numeric` as a single translation, runs of spaces are dropped by `split`
+_CLEAN_TABLE = str.maketrans(string.punctuation, ' ' * len(string.punctuation), string.digits)
+
+
+def tokenize(text):
+    """Extracts tokens and hashtags of a document.
+
+    Equivalent to applying the `CorpusDocument` filter chain with `gpp.preprocess_string`
+      with fewer passes over the text.
+
+    :param text: text of the document.
+    :return: tuple of (tokens, hashtags).
+    """
+    hashtags = HASHTAG_PATTERN.findall(text)
+    text = text.lower()
+    # patterns are only applied if they can match
+    if 'http' in text:
+        text = URL_PATTERN.sub(' ', text)
+    if ('#' in text) or ('@' in text):
+        text = SOCIAL_PATTERN.sub(' ', text)
+    if 'http' in text:
+        text = URL_PATTERN_2.sub(' ', text)
+    if '<' in text:
+        text = TAG_PATTERN.sub('', text)
+    text = text.translate(_CLEAN_TABLE) + ' '.join(hashtags)
+    stopwords = gpp.STOPWORDS
+    return [token for token in text.split() if (len(token) >= 3) and (token not in stopwords)], hashtags
+
+
+def _get_keyword_processor():
+    if CorpusDocument.keyword_processor is None:
+        CorpusDocument.keyword_processor = load_keyword_processor(keywords)
+    return CorpusDocument.keyword_processor
+
+
+def tokenize_many(texts, return_keywords=False, keyword_processor=None):
+    """Extracts tokens (and keywords) of many documents.
+
+    :param texts: iterable of document texts.
+    :param return_keywords: whether to extract keywords in the same pass.
+    :param keyword_processor: `KeywordProcessor` to extract keywords with, defaults to the keyword processor of
+        `CorpusDocument`.
+    :return: list of tokens of each document, or list of (tokens, hashtags, keywords) tuples
+        if `return_keywords` is set.
+    """
+    if not return_keywords:
+        return [tokenize(text)[0] for text in texts]
+    if keyword_processor is None:
+        keyword_processor = _get_keyword_processor()
+    extract_keywords = keyword_processor.extract_keywords
+    result = []
+    for text in texts:
+        tokens, hashtags = tokenize(text)
+        result.append((tokens, hashtags, extract_keywords(text)))
+    return result
+
+
+def _create_many(cls, texts, authors=None, keys=None, token_cache=None):
+    if authors is None:
+        authors = [None] * len(texts)
+    token_cache = _get_token_cache(token_cache)
+    if token_cache is None:
+        values = tokenize_many(texts, return_keywords=True)
+    else:
+        values = token_cache.tokenize_many(texts, keys=keys)
+    return [
+        cls(text, author=author, tokens=tokens, hashtags=hashtags, keywords=doc_keywords)
+        for text, author, (tokens, hashtags, doc_keywords) in zip(texts, authors, values)
+    ]
 
 
 class CorpusDocument(object):
     """Represents a document for topic modeling."""
     keyword_processor = None
-    url_pattern = re.compile('http[s]?://\S+')
-    url_pattern_2 = re.compile('\Bhttp[s]?\S+')
-    hashtag_pattern = re.compile('\B\#[a-zA-Z0-9_]+')
-    mention_pattern = re.compile('\B\@[a-zA-Z0-9_]+')
+    url_pattern = URL_PATTERN
+    url_pattern_2 = URL_PATTERN_2
+    hashtag_pattern = HASHTAG_PATTERN
+    mention_pattern = MENTION_PATTERN
+
+    def __init__(self, text, author=None, tokens=None, hashtags=None, keywords=None):
+        """Creates a document, tokens and keywords are extracted from the text if not provided.
 
-    def __init__(self, text, author=None):
+        :param text: text of the document.
+        :param author: author of the document.
+        :param tokens: precomputed tokens, see `tokenize_many`.
+        :param hashtags: precomputed hashtags, see `tokenize_many`.
+        :param keywords: precomputed keywords, see `tokenize_many`.
+        """
         self._text = text
         self._author = author
-        self._hashtags = CorpusDocument.hashtag_pattern.findall(self._text)
-        self._tokens = gpp.preprocess_string(self._text, filters=[
-            gpp.lower_to_unicode,
-            lambda x: CorpusDocument.url_pattern.sub(' ', x),
-            lambda x: CorpusDocument.hashtag_pattern.sub(' ', x),
-            lambda x: CorpusDocument.mention_pattern.sub(' ', x),
-            lambda x: CorpusDocument.url_pattern_2.sub(' ', x),
-            gpp.strip_tags,
-            gpp.strip_punctuation,
-            gpp.strip_numeric,
-            lambda x: x + ' '.join(self._hashtags),
-            gpp.remove_stopwords,
-            gpp.strip_short,
-            gpp.strip_multiple_whitespaces,
-        ])
-        if CorpusDocument.keyword_processor is None:
-            CorpusDocument.keyword_processor = KeywordProcessor(case_sensitive=False)
-            CorpusDocument.keyword_processor.add_keywords_from_dict(keywords)
-        self.keywords = CorpusDocument.keyword_processor.extract_keywords(self._text)
+        if tokens is None:
+            tokens, hashtags = tokenize(self._text)
+        self._hashtags = hashtags
+        self._tokens = tokens
+        if keywords is None:
+            keywords = _get_keyword_processor().extract_keywords(self._text)
+        self.keywords = keywords
+
+    @classmethod
+    def create_many(cls, texts, authors=None, keys=None, token_cache=None):
+        """Creates documents in a batch, see `tokenize_many`.
+
+        :param texts: list of document texts.
+        :param authors: list of authors of the documents.
+        :param keys: list of token cache keys of the documents, defaults to hashes of the texts.
+        :param token_cache: `TokenCache`, path to the cache database or True for the default cache.
+            If provided, tokens are read from the cache and only documents missing from it are tokenized.
+        :return: list of documents.
+        """
+        return _create_many(cls, texts, authors=authors, keys=keys, token_cache=token_cache)
 
     @property
     def text(self):
@@ -78,29 +179,243 @@ class CorpusDocument(object):
         return len(self.keywords) > 0
 
 
-def load_documents(path=None, verbose=False):
+def _intern(values):
+    if not values:
+        return ()
+    return tuple(sys.intern(x) for x in values)
+
+
+class LazyCorpusDocument(object):
+    """Memory efficient document for topic modeling.
+
+    Same interface as `CorpusDocument` with tokens, hashtags and keywords extracted on first access and stored
+      as tuples of interned strings, so that tokens are shared among documents. The text can be dropped once
+      the document is tokenized (see `drop_text`).
+    """
+    __slots__ = ('_text', '_author', '_tokens', '_hashtags', '_keywords')
+
+    def __init__(self, text, author=None, tokens=None, hashtags=None, keywords=None):
+        """Creates a document, tokens and keywords are extracted from the text on first access if not provided.
+
+        :param text: text of the document.
+        :param author: author of the document.
+        :param tokens: precomputed tokens, see `tokenize_many`.
+        :param hashtags: precomputed hashtags, see `tokenize_many`.
+        :param keywords: precomputed keywords, see `tokenize_many`.
+        """
+        self._text = text
+        self._author = author
+        self._tokens = None
+        self._hashtags = None
+        self._keywords = None
+        if tokens is not None:
+            self._tokens, self._hashtags = _intern(tokens), _intern(hashtags)
+        if keywords is not None:
+            self._keywords = _intern(keywords)
+
+    @classmethod
+    def create_many(cls, texts, authors=None, keys=None, token_cache=None):
+        """Creates tokenized documents in a batch, see `CorpusDocument.create_many`.
+
+        :param texts: list of document texts.
+        :param authors: list of authors of the documents.
+        :param keys: list of token cache keys of the documents, defaults to hashes of the texts.
+        :param token_cache: `TokenCache`, path to the cache database or True for the default cache.
+        :return: list of documents.
+        """
+        return _create_many(cls, texts, authors=authors, keys=keys, token_cache=token_cache)
+
+    def _tokenize(self):
+        if self._text is None:
+            raise ValueError('text of the document was dropped before tokenization.')
+        if self._tokens is None:
+            tokens, hashtags = tokenize(self._text)
+            self._tokens, self._hashtags = _intern(tokens), _intern(hashtags)
+        if self._keywords is None:
+            self._keywords = _intern(_get_keyword_processor().extract_keywords(self._text))
+
+    def drop_text(self):
+        """Tokenizes the document if required and releases its text.
+
+        :return: self.
+        """
+        self._tokenize()
+        self._text = None
+        return self
+
+    @property
+    def text(self):
+        """Gets text of document.
+
+        :return:
+            text: str or None if dropped.
+        """
+        return self._text
+
+    @property
+    def author_id(self):
+        """Gets author of document.
+
+        :return:
+            author: str
+        """
+        return self._author
+
+    @property
+    def tokens(self):
+        """Gets tokens of this document.
+
+        :return:
+            tokens: tuple[str]
+        """
+        if self._tokens is None:
+            self._tokenize()
+        return self._tokens
+
+    @property
+    def hashtags(self):
+        """Gets hashtags of this document.
+
+        :return:
+            hashtags: tuple[str]
+        """
+        if self._hashtags is None:
+            self._tokenize()
+        return self._hashtags
+
+    @property
+    def keywords(self):
+        """Gets keywords of this document.
+
+        :return:
+            keywords: tuple[str]
+        """
+        if self._keywords is None:
+            self._tokenize()
+        return self._keywords
+
+    @property
+    def has_keyword(self):
+        """Gets whether there is a keyword
+
+        :return:
+        """
+        return len(self.keywords) > 0
+
+
+def _get_token_cache(token_cache):
+    from src.corpus.token_cache import TokenCache
+    if (token_cache is None) or isinstance(token_cache, TokenCache):
+        return token_cache
+    return TokenCache(cache_path=None if token_cache is True else token_cache)
+
+
+def _iter_chunks(lines, chunk_size):
+    chunk = []
+    for _, _, line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker():
+    _get_keyword_processor()
+
+
+def _decode_chunk(lines, decoder=None):
+    from src.corpus.token_cache import id_key, text_key
+    loads = jsonline.get_decoder(decoder)
+    texts, authors, keys = [], [], []
+    for line in lines:
+        record = loads(line)
+        text = record['tweet']['text']
+        tweet_id = record['tweet'].get('id')
+        texts.append(text)
+        authors.append(record['subject_id'])
+        keys.append(text_key(text) if tweet_id is None else id_key(tweet_id))
+    return texts, authors, keys
+
+
+def _lookup_chunk(lines, token_cache, decoder=None):
+    texts, authors, keys = _decode_chunk(lines, decoder=decoder)
+    return texts, authors, keys, token_cache.get_many(keys)
+
+
+def _load_chunk(chunk, decoder=None, tokenize=True):
+    # chunks are raw lines, or decoded documents with their cached tokens if a token cache is used
+    if isinstance(chunk, list):
+        texts, authors, keys = _decode_chunk(chunk, decoder=decoder)
+        values = [None] * len(texts)
+    else:
+        texts, authors, keys, values = chunk
+    if not tokenize:
+        return texts, authors, keys, values, []
+    missing = [i for i, value in enumerate(values) if value is None]
+    for i, value in zip(missing, tokenize_many([texts[i] for i in missing], return_keywords=True)):
+        values[i] = value
+    return texts, authors, keys, values, missing
+
+
+def load_documents(path=None, verbose=False, num_workers=0, chunk_size=1000, prefetch=None, decoder=None,
+                   token_cache=None, document_class=None):
     """Loads all documents in the path provided.
     Each line should indicate a document with fields 'tweet', 'subject_id' at least.
 
+    The file is streamed in chunks of `chunk_size` lines so that memory use does not depend on the size of
+      the file. When `num_workers` is set, chunks are tokenized in a pool of processes, each initializing
+      the keyword processor once, and documents are returned in the order of the file.
+
     :param path: path to the jsonline file containing documents in each line.
     :param verbose: whether to print the loading progress.
+    :param num_workers: number of processes to tokenize documents with, 0 tokenizes in the calling process.
+        None uses all CPUs, see `parallel.get_num_workers`.
+    :param chunk_size: number of lines sent to a worker at once.
+    :param prefetch: maximum number of chunks in flight. Defaults to twice the number of workers.
+    :param decoder: JSON decoder backend, see `jsonline.get_decoder`.
+    :param token_cache: `TokenCache`, path to the cache database or True for the default cache.
+        If provided, only documents missing from the cache are tokenized. Documents are keyed by tweet id if available.
+    :param document_class: class of the returned documents {`CorpusDocument`, `LazyCorpusDocument`}.
+        Defaults to `CorpusDocument`. `LazyCorpusDocument` documents are tokenized on first access if no token
+        cache is used.
     :return: generator of documents.
     """
     if path is None:
         path = os.path.join(config['DEFAULT']['project_path'], 'data', 'interim', 'tweets_intra_subject_analysis.jsonl')
-    with open(path, 'r') as fp:
-        lines = fp.readlines()
-        # if not isinstance(verbose, bool) and (verbose is not None):
-        #     lines = _progress(lines, verbose)
-        # else:
-        if verbose:
-            lines = tqdm.tqdm(lines, desc='Loading Documents')
-        for line in lines:
-            record = json.loads(line)
-            text = record['tweet']['text']
-            author = record['subject_id']
-            cd = CorpusDocument(text=text, author=author)
-            yield cd
+    if chunk_size < 1:
+        raise ValueError('chunk_size should be a positive integer, found {}'.format(chunk_size))
+    if document_class is None:
+        document_class = CorpusDocument
+    pbar = tqdm.tqdm(desc='Loading Documents', unit='docs') if verbose else None
+    token_cache = _get_token_cache(token_cache)
+    chunks = _iter_chunks(jsonline.iter_lines(path), chunk_size)
+    if token_cache is not None:
+        chunks = (_lookup_chunk(lines, token_cache, decoder=decoder) for lines in chunks)
+    # lazy documents are tokenized on first access unless tokens are cached
+    tokenize = (token_cache is not None) or not issubclass(document_class, LazyCorpusDocument)
+    func = functools.partial(_load_chunk, decoder=decoder, tokenize=tokenize)
+    if num_workers == 0:
+        results = map(func, chunks)
+    else:
+        results = parallel.imap(func, chunks, num_workers=num_workers, prefetch=prefetch, executor='process',
+                                initializer=_init_worker)
+    try:
+        for texts, authors, keys, values, missing in results:
+            if (token_cache is not None) and missing:
+                token_cache.put_many([keys[i] for i in missing], [values[i] for i in missing])
+            if pbar is not None:
+                pbar.update(len(texts))
+            for text, author, value in zip(texts, authors, values):
+                if value is None:
+                    yield document_class(text, author=author)
+                    continue
+                tokens, hashtags, doc_keywords = value
+                yield document_class(text, author=author, tokens=tokens, hashtags=hashtags, keywords=doc_keywords)
+    finally:
+        if pbar is not None:
+            pbar.close()
 
 
 def _progress(lines, verbose):
@@ -1,10 +1,36 @@
+"""Functions for loading keywords and matching them in documents.
+
+Keywords are matched with a flashtext `KeywordProcessor`. The processor built from the keywords is saved
+  (see `save_keyword_processor`) so that each process loads the prebuilt matcher once instead of building it.
+
+Usage (from project root):
+    python -m src.corpus.keywords
+"""
+import array
+import hashlib
+import json
 import os
+import pickle
 from collections import defaultdict
 
+import numpy as np
 import pandas as pd
+import scipy.sparse
+from flashtext import KeywordProcessor
 
 from src.config import config
 
+__all__ = [
+    'load_keywords',
+    'keywords',
+    'get_keywords_fingerprint',
+    'get_keyword_processor_path',
+    'build_keyword_processor',
+    'save_keyword_processor',
+    'load_keyword_processor',
+    'get_keyword_matrix',
+]
+
 
 def load_keywords(path=None, level='phrase'):
     """Loads keywords from the path provided.
@@ -33,3 +59,124 @@ try:
     keywords = load_keywords()
 except FileNotFoundError as ex:
     keywords = None
+
+
+def _get_keywords(values):
+    return keywords if values is None else values
+
+
+def get_keywords_fingerprint(keywords):
+    """Gets the fingerprint of keywords.
+
+    :param keywords: mapping of topics to keywords.
+    :return: fingerprint (hex str).
+    """
+    state = {k: sorted(v) for k, v in (keywords or {}).items()}
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_keyword_processor_path(path=None):
+    """Gets path to the prebuilt keyword processor.
+
+    :param path: path to the keyword processor, defaults to `data/interim/keyword_processor.pkl` in project path.
+    :return: path to the keyword processor.
+    """
+    if path is None:
+        path = os.path.join(config['DEFAULT']['project_path'], 'data', 'interim', 'keyword_processor.pkl')
+    return path
+
+
+def build_keyword_processor(keywords=None):
+    """Builds a keyword processor matching keywords case insensitively.
+
+    :param keywords: mapping of topics to keywords, defaults to the keywords loaded on import.
+    :return: `KeywordProcessor` extracting the topics of matched keywords.
+    """
+    keywords = _get_keywords(keywords)
+    keyword_processor = KeywordProcessor(case_sensitive=False)
+    keyword_processor.add_keywords_from_dict(keywords)
+    return keyword_processor
+
+
+def save_keyword_processor(keywords=None, path=None):
+    """Builds and saves the keyword processor.
+
+    :param keywords: mapping of topics to keywords, defaults to the keywords loaded on import.
+    :param path: path to the keyword processor, see `get_keyword_processor_path`.
+    :return: `KeywordProcessor`.
+    """
+    keywords = _get_keywords(keywords)
+    path = get_keyword_processor_path(path)
+    keyword_processor = build_keyword_processor(keywords)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # unique per process as workers may build the keyword processor at the same time
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        pickle.dump({'fingerprint': get_keywords_fingerprint(keywords), 'keyword_processor': keyword_processor}, fp)
+    os.replace(tmp_path, path)
+    return keyword_processor
+
+
+def load_keyword_processor(keywords=None, path=None, save=True):
+    """Loads the prebuilt keyword processor, building it if missing or built from other keywords.
+
+    :param keywords: mapping of topics to keywords, defaults to the keywords loaded on import.
+    :param path: path to the keyword processor, see `get_keyword_processor_path`.
+    :param save: whether to save the keyword processor if it is built.
+    :return: `KeywordProcessor`.
+    """
+    keywords = _get_keywords(keywords)
+    path = get_keyword_processor_path(path)
+    if os.path.exists(path):
+        with open(path, 'rb') as fp:
+            artifact = pickle.load(fp)
+        if artifact['fingerprint'] == get_keywords_fingerprint(keywords):
+            return artifact['keyword_processor']
+    if save:
+        return save_keyword_processor(keywords, path=path)
+    return build_keyword_processor(keywords)
+
+
+def get_keyword_matrix(docs, topics=None, keyword_processor=None):
+    """Gets the number of keyword matches of each topic in each document.
+
+    :param docs: iterable of documents with `keywords` (e.g., `CorpusDocument`) or texts.
+    :param topics: topics of the columns. Defaults to the topics found in the documents, sorted by name.
+        Matches of other topics are ignored.
+    :param keyword_processor: keyword processor to extract keywords of texts, see `load_keyword_processor`.
+    :return: tuple of (`scipy.sparse.csr_matrix` of shape (num_docs, num_topics), list of topics).
+    """
+    topic2id = {} if topics is None else {topic: i for i, topic in enumerate(topics)}
+    indices, indptr = array.array('i'), array.array('q', [0])
+    for doc in docs:
+        if isinstance(doc, str):
+            if keyword_processor is None:
+                keyword_processor = load_keyword_processor()
+            doc_keywords = keyword_processor.extract_keywords(doc)
+        else:
+            doc_keywords = doc.keywords
+        for topic in doc_keywords:
+            if topic not in topic2id:
+                if topics is not None:
+                    continue
+                topic2id[topic] = len(topic2id)
+            indices.append(topic2id[topic])
+        indptr.append(len(indices))
+    indices = np.frombuffer(indices, dtype=np.int32)
+    if topics is None:
+        # order columns by topic name
+        topics = sorted(topic2id)
+        permutation = np.zeros(len(topics), dtype=np.int32)
+        for i, topic in enumerate(topics):
+            permutation[topic2id[topic]] = i
+        indices = permutation[indices]
+    matrix = scipy.sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), indices, np.frombuffer(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(topics))
+    )
+    matrix.sum_duplicates()
+    return matrix, list(topics)
+
+
+if __name__ == '__main__':
+    save_keyword_processor()
@@ -0,0 +1,341 @@
+"""Columnar store of tweets partitioned by user and month.
+
+Raw timelines at `data/raw/tweets/<twitter>/YYYY-MM.jsonl` are converted to
+  `data/processed/tweets/<twitter>/YYYY-MM/` directories with one file per column.
+  Integer columns are stored as `.npy` arrays and string columns as a blob of utf-8 bytes (`.bin`)
+  with an offsets array (`.offsets.npy`). All files are read through mmap.
+
+Usage (from project root):
+    python -m src.corpus.store
+"""
+import collections
+import json
+import mmap
+import os
+import shutil
+
+import numpy as np
+import tqdm
+
+from src.config import config
+from src.utils import jsonline
+
+__all__ = [
+    'STORE_COLUMNS',
+    'TweetPartition',
+    'get_store_path',
+    'get_partition_path',
+    'write_partition',
+    'open_partition',
+    'ingest_tweets',
+]
+
+STORE_COLUMNS = ('id', 'text', 'created_at', 'lang')
+
+_INT_COLUMNS = {'id'}
+
+_META_FILENAME = 'meta.json'
+
+
+def get_store_path(store_path=None):
+    """Gets path to the root directory of the columnar store.
+
+    :param store_path: path to the store, defaults to `data/processed/tweets` in project path.
+    :return: path to the store.
+    """
+    if store_path is None:
+        store_path = os.path.join(config['DEFAULT']['project_path'], 'data', 'processed', 'tweets')
+    return store_path
+
+
+def get_partition_path(store_path, twitter, year, month):
+    """Gets path to the directory of a single partition.
+
+    :param store_path: path to the root directory of the store.
+    :param twitter: twitter handle of the timeline.
+    :param year: year of the timeline file.
+    :param month: month of the timeline file.
+    :return: path to the partition directory.
+    """
+    return os.path.join(store_path, twitter, '{}-{:02}'.format(year, month))
+
+
+def _source_stat(source):
+    if source is None:
+        return None
+    stat = os.stat(source)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _write_string_column(path, name, values):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    nulls = np.zeros(len(values), dtype=bool)
+    with open(os.path.join(path, '{}.bin'.format(name)), 'wb') as fp:
+        position = 0
+        for i, value in enumerate(values):
+            if value is None:
+                nulls[i] = True
+            else:
+                data = str(value).encode('utf-8')
+                fp.write(data)
+                position += len(data)
+            offsets[i + 1] = position
+    np.save(os.path.join(path, '{}.offsets.npy'.format(name)), offsets)
+    if nulls.any():
+        np.save(os.path.join(path, '{}.null.npy'.format(name)), nulls)
+
+
+def _write_int_column(path, name, values):
+    nulls = np.array([value is None for value in values], dtype=bool)
+    array = np.array([0 if value is None else int(value) for value in values], dtype=np.int64)
+    np.save(os.path.join(path, '{}.npy'.format(name)), array)
+    if nulls.any():
+        np.save(os.path.join(path, '{}.null.npy'.format(name)), nulls)
+    # type of the raw values, integers are returned as they were read
+    raw_type = next((type(value).__name__ for value in values if value is not None), 'str')
+    return 'int' if raw_type == 'int' else 'str'
+
+
+def _load_nulls(path, name):
+    null_path = os.path.join(path, '{}.null.npy'.format(name))
+    return np.load(null_path, mmap_mode='r') if os.path.exists(null_path) else None
+
+
+def write_partition(tweets, path, source=None):
+    """Writes tweets to a partition of the columnar store.
+
+    The partition is written to a temporary directory first and moved in place once complete.
+
+    :param tweets: iterable of tweets (dict).
+    :param path: path to the partition directory.
+    :param source: path to the raw timeline file the tweets are read from, if any.
+    :return: number of tweets written.
+    """
+    columns = {name: [] for name in STORE_COLUMNS}
+    for tweet in tweets:
+        for name in STORE_COLUMNS:
+            columns[name].append(tweet.get(name))
+    num_rows = len(columns['id'])
+    tmp_path = '{}.tmp'.format(path)
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    int_types = {}
+    for name, values in columns.items():
+        if name in _INT_COLUMNS:
+            int_types[name] = _write_int_column(tmp_path, name, values)
+        else:
+            _write_string_column(tmp_path, name, values)
+    lang_counts = collections.Counter(lang for lang in columns['lang'] if lang is not None)
+    meta = {
+        'num_rows': num_rows,
+        'columns': list(STORE_COLUMNS),
+        'int_types': int_types,
+        'lang_counts': dict(lang_counts),
+        'source': _source_stat(source),
+    }
+    with open(os.path.join(tmp_path, _META_FILENAME), 'w', encoding='utf-8') as fp:
+        json.dump(meta, fp)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return num_rows
+
+
+class _StringColumn(object):
+    """String column backed by a mmap of the utf-8 blob."""
+
+    def __init__(self, path, name):
+        self._offsets = np.load(os.path.join(path, '{}.offsets.npy'.format(name)), mmap_mode='r')
+        self._nulls = _load_nulls(path, name)
+        self._data = b''
+        with open(os.path.join(path, '{}.bin'.format(name)), 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size > 0:
+                self._data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if (self._nulls is not None) and self._nulls[idx]:
+            return None
+        return self._data[int(self._offsets[idx]):int(self._offsets[idx + 1])].decode('utf-8')
+
+    def __iter__(self):
+        data = self._data
+        offsets = self._offsets.tolist()
+        nulls = [False] * len(self) if self._nulls is None else self._nulls.tolist()
+        for start, end, is_null in zip(offsets[:-1], offsets[1:], nulls):
+            yield None if is_null else data[start:end].decode('utf-8')
+
+
+class TweetPartition(object):
+    """Read-only view of a single partition of the columnar store."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, _META_FILENAME), 'r', encoding='utf-8') as fp:
+            self.meta = json.load(fp)
+        self._columns = {}
+
+    def __len__(self):
+        return self.meta['num_rows']
+
+    @property
+    def columns(self):
+        """Gets names of the columns available in this partition.
+
+        :return: list of column names.
+        """
+        return self.meta['columns']
+
+    @property
+    def lang_counts(self):
+        """Gets the number of tweets of each language in this partition.
+
+        :return: mapping of language to number of tweets or None if not recorded at ingest.
+        """
+        return self.meta.get('lang_counts')
+
+    def is_fresh(self, source):
+        """Checks whether the partition is up-to-date with the raw timeline file.
+
+        :param source: path to the raw timeline file.
+        :return: True if the source is missing or unchanged since the partition was written.
+        """
+        if not os.path.exists(source):
+            return True
+        return self.meta.get('source') == _source_stat(source)
+
+    def column(self, name):
+        """Gets a column of the partition.
+
+        :param name: name of the column.
+        :return: `numpy.memmap` for integer columns (0 for missing values, see `nulls`) and a sequence of str
+            (None for missing values) for string columns.
+        """
+        if name not in self._columns:
+            if name not in self.columns:
+                raise KeyError('column not found in store: {}'.format(name))
+            if name in _INT_COLUMNS:
+                self._columns[name] = np.load(os.path.join(self.path, '{}.npy'.format(name)), mmap_mode='r')
+            else:
+                self._columns[name] = _StringColumn(self.path, name)
+        return self._columns[name]
+
+    def nulls(self, name):
+        """Gets the missing values of a column.
+
+        :param name: name of the column.
+        :return: boolean `numpy.memmap`, True for missing values, or None if no value is missing.
+        """
+        if name not in self.columns:
+            raise KeyError('column not found in store: {}'.format(name))
+        return _load_nulls(self.path, name)
+
+    def iter_records(self, columns=None, lang=None):
+        """Iterates over records of this partition.
+
+        Integer columns are returned with the type of the raw tweets (str unless they were int), missing values
+          are returned as None.
+
+        :param columns: columns to include in each record, defaults to all columns.
+        :param lang: only return records with this language if provided.
+        :return: generator of records (dict).
+        """
+        if columns is None:
+            columns = self.columns
+        values = []
+        # partitions written before the types were recorded have str ids
+        int_types = self.meta.get('int_types', {})
+        for name in columns:
+            if name in _INT_COLUMNS:
+                column = self.column(name).tolist()
+                if int_types.get(name, 'str') == 'str':
+                    column = [str(x) for x in column]
+                nulls = self.nulls(name)
+                if nulls is not None:
+                    column = [None if is_null else x for x, is_null in zip(column, nulls.tolist())]
+                values.append(column)
+            else:
+                values.append(iter(self.column(name)))
+        langs = iter(self.column('lang')) if lang is not None else None
+        for row in (zip(*values) if values else ([] for _ in range(len(self)))):
+            if (langs is not None) and (next(langs) != lang):
+                continue
+            yield dict(zip(columns, row))
+
+
+def open_partition(store_path, twitter, year, month, source=None):
+    """Opens a partition of the store if it exists and is up-to-date.
+
+    :param store_path: path to the root directory of the store.
+    :param twitter: twitter handle of the timeline.
+    :param year: year of the timeline file.
+    :param month: month of the timeline file.
+    :param source: path to the raw timeline file to check freshness against.
+    :return: `TweetPartition` or None if not available.
+    """
+    path = get_partition_path(store_path, twitter, year, month)
+    if not os.path.exists(os.path.join(path, _META_FILENAME)):
+        return None
+    partition = TweetPartition(path)
+    if (source is not None) and not partition.is_fresh(source):
+        return None
+    return partition
+
+
+def ingest_tweets(path=None, store_path=None, filters=None, overwrite=False, verbose=1, tweet_index=None):
+    """Converts raw timeline files into the columnar store.
+
+    Partitions that are up-to-date with their raw timeline file are skipped unless `overwrite` is set.
+
+    :param path: path to the root directory containing tweets.
+    :param store_path: path to the root directory of the store.
+    :param filters: list of files metadata for ingesting. Should be a dict with keys ['twitter', 'year', 'month'].
+    :param overwrite: whether to rewrite partitions that are up-to-date.
+    :param verbose: whether to show progress bar.
+    :param tweet_index: `TweetIndex`, path to the index database or True for the default index.
+        If provided, the tweet id index (see `src.corpus.tweet_index`) is updated in the same pass.
+    :return: number of partitions written.
+    """
+    from src.corpus.twitter import load_availability
+    from src.corpus.tweet_index import TweetIndex
+    if path is None:
+        path = os.path.join(config['DEFAULT']['project_path'], 'data', 'raw', 'tweets')
+    store_path = get_store_path(store_path)
+    if filters is None:
+        filters = load_availability(path=path)
+    close_index = (tweet_index is not None) and not isinstance(tweet_index, TweetIndex)
+    if close_index:
+        tweet_index = TweetIndex(path=path, index_path=None if tweet_index is True else tweet_index)
+    if verbose:
+        filters = tqdm.tqdm(filters, desc='Ingesting Tweets')
+    num_written = 0
+    try:
+        for item in filters:
+            twitter, year, month = item['twitter'], item['year'], item['month']
+            source = jsonline.find_file(os.path.join(path, twitter, '{}-{:02}'.format(year, month)))
+            index_fresh = (tweet_index is None) or tweet_index.is_fresh(twitter, year, month)
+            partition_fresh = open_partition(store_path, twitter, year, month, source=source) is not None
+            if (not overwrite) and partition_fresh:
+                if not index_fresh:
+                    tweet_index.index_file(twitter, year, month)
+                continue
+            if tweet_index is not None:
+                tweets = tweet_index.iter_file(twitter, year, month)
+            else:
+                tweets = jsonline.load(source, decoder='auto')
+            partition_path = get_partition_path(store_path, twitter, year, month)
+            os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+            write_partition(tweets, partition_path, source=source)
+            num_written += 1
+    finally:
+        # indexes opened here are closed here
+        if close_index:
+            tweet_index.close()
+    return num_written
+
+
+if __name__ == '__main__':
+    ingest_tweets(tweet_index=True)
@@ -0,0 +1,205 @@
+"""Persistent cache of document tokens.
+
+The cache is a sqlite database mapping a document key to the (tokens, hashtags, keywords) extracted by
+  `src.corpus.documents.tokenize_many`. Keys are tweet ids when available (see `id_key`) and a hash of the
+  text otherwise (see `text_key`).
+
+Entries are only valid for the tokenizer and keywords they were extracted with. The cache records a
+  fingerprint of both (see `get_fingerprint`) and is cleared automatically when it changes. Bump
+  `src.corpus.documents.TOKENIZER_VERSION` when changing the tokenizer in a way the fingerprint cannot see.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from src.config import config
+from src.corpus import documents
+from src.corpus.keywords import build_keyword_processor, get_keywords_fingerprint
+
+__all__ = [
+    'TokenCache',
+    'get_token_cache_path',
+    'get_fingerprint',
+    'text_key',
+    'id_key',
+]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tokens (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    accessed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_accessed_idx ON tokens (accessed);
+'''
+
+# maximum number of parameters in a single sqlite query
+_MAX_QUERY_PARAMS = 900
+
+
+def get_token_cache_path(cache_path=None):
+    """Gets path to the token cache database.
+
+    :param cache_path: path to the cache, defaults to `data/interim/tokens_cache.sqlite` in project path.
+    :return: path to the cache.
+    """
+    if cache_path is None:
+        cache_path = os.path.join(config['DEFAULT']['project_path'], 'data', 'interim', 'tokens_cache.sqlite')
+    return cache_path
+
+
+def get_fingerprint(keywords=None):
+    """Gets the fingerprint of the tokenizer and keywords of `CorpusDocument`.
+
+    :param keywords: mapping of topics to keywords, defaults to the keywords used by `CorpusDocument`.
+    :return: fingerprint (hex str).
+    """
+    if keywords is None:
+        keywords = documents.keywords
+    state = {
+        'version': documents.TOKENIZER_VERSION,
+        'patterns': [
+            documents.URL_PATTERN.pattern,
+            documents.URL_PATTERN_2.pattern,
+            documents.HASHTAG_PATTERN.pattern,
+            documents.SOCIAL_PATTERN.pattern,
+            documents.TAG_PATTERN.pattern,
+        ],
+        'stopwords': sorted(documents.gpp.STOPWORDS),
+        'keywords': get_keywords_fingerprint(keywords),
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def text_key(text):
+    """Gets the cache key of a document from its text.
+
+    :param text: text of the document.
+    :return: key (str).
+    """
+    return 'text:' + hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def id_key(doc_id):
+    """Gets the cache key of a document from its tweet id.
+
+    :param doc_id: tweet id (int or str).
+    :return: key (str).
+    """
+    return 'id:{}'.format(int(doc_id))
+
+
+class TokenCache(object):
+    """On-disk cache of (tokens, hashtags, keywords) of documents."""
+
+    def __init__(self, cache_path=None, max_entries=None, keywords=None):
+        """Opens (or creates) the token cache.
+
+        :param cache_path: path to the cache database.
+        :param max_entries: maximum number of entries kept in the cache. Least recently used entries are
+            evicted once exceeded. No limit if None.
+        :param keywords: keywords to extract and fingerprint the entries with, defaults to the keywords of
+            `CorpusDocument`.
+        """
+        self.cache_path = get_token_cache_path(cache_path)
+        self.max_entries = max_entries
+        self.fingerprint = get_fingerprint(keywords)
+        # None uses the keyword processor of `CorpusDocument`
+        self.keyword_processor = None if keywords is None else build_keyword_processor(keywords)
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._conn = sqlite3.connect(self.cache_path)
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', ('fingerprint',)).fetchone()
+        if (row is not None) and (row[0] != self.fingerprint):
+            # entries were extracted with a different tokenizer or keywords
+            self._conn.execute('DELETE FROM tokens')
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('fingerprint', self.fingerprint))
+        self._conn.commit()
+
+    def close(self):
+        """Closes connection to the cache database.
+
+        :return: None.
+        """
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM tokens').fetchone()[0]
+
+    def get_many(self, keys):
+        """Gets cached entries.
+
+        :param keys: document keys, see `text_key` and `id_key`.
+        :return: list of (tokens, hashtags, keywords) tuples in the order of `keys`, None for missing keys.
+        """
+        keys = list(keys)
+        found = {}
+        for i in range(0, len(keys), _MAX_QUERY_PARAMS):
+            chunk = keys[i:i + _MAX_QUERY_PARAMS]
+            sql = 'SELECT key, value FROM tokens WHERE key IN ({})'.format(', '.join('?' for _ in chunk))
+            for key, value in self._conn.execute(sql, chunk):
+                found[key] = tuple(json.loads(value))
+        if found:
+            accessed = time.time_ns()
+            self._conn.executemany('UPDATE tokens SET accessed = ? WHERE key = ?', ((accessed, k) for k in found))
+            self._conn.commit()
+        return [found.get(key) for key in keys]
+
+    def put_many(self, keys, values):
+        """Adds entries to the cache, evicting least recently used entries if the cache is full.
+
+        :param keys: document keys, see `text_key` and `id_key`.
+        :param values: (tokens, hashtags, keywords) tuples of the documents.
+        :return: None.
+        """
+        accessed = time.time_ns()
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO tokens (key, value, accessed) VALUES (?, ?, ?)',
+            ((key, json.dumps(list(value)), accessed) for key, value in zip(keys, values))
+        )
+        if self.max_entries is not None:
+            num_evicted = len(self) - self.max_entries
+            if num_evicted > 0:
+                self._conn.execute('DELETE FROM tokens WHERE key IN '
+                                   '(SELECT key FROM tokens ORDER BY accessed LIMIT ?)', (num_evicted,))
+        self._conn.commit()
+
+    def clear(self):
+        """Removes all entries from the cache.
+
+        :return: None.
+        """
+        self._conn.execute('DELETE FROM tokens')
+        self._conn.commit()
+
+    def tokenize_many(self, texts, keys=None):
+        """Gets (tokens, hashtags, keywords) of documents, tokenizing and caching only the missing ones.
+
+        :param texts: list of document texts.
+        :param keys: list of document keys, defaults to `text_key` of each text.
+        :return: list of (tokens, hashtags, keywords) tuples, see `documents.tokenize_many`.
+        """
+        if keys is None:
+            keys = [text_key(text) for text in texts]
+        values = self.get_many(keys)
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            extracted = documents.tokenize_many([texts[i] for i in missing], return_keywords=True,
+                                                keyword_processor=self.keyword_processor)
+            for i, value in zip(missing, extracted):
+                values[i] = value
+            # keys may repeat within a batch, store each once
+            new = dict(zip([keys[i] for i in missing], extracted))
+            self.put_many(list(new.keys()), list(new.values()))
+        return values
@@ -0,0 +1,299 @@
+"""Persistent index from tweet id to its location in the raw timeline files.
+
+The index is a sqlite database mapping each tweet id to (twitter, year, month, offset, length) where
+  offset and length locate the line of the tweet in the (decompressed) timeline file. Lookups are grouped
+  by file so that each tweet costs a single read: a slice of a mmap for uncompressed files and a single block
+  for block-compressed files (see `src.utils.jsonline.compress`).
+"""
+import bisect
+import mmap
+import os
+import sqlite3
+
+import tqdm
+
+from src.config import config
+from src.utils import jsonline
+
+__all__ = [
+    'TweetIndex',
+    'get_tweet_index_path',
+    'build_tweet_index',
+    'get_tweets',
+]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    twitter TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (twitter, year, month)
+);
+CREATE TABLE IF NOT EXISTS tweets (
+    id INTEGER PRIMARY KEY,
+    twitter TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tweets_file_idx ON tweets (twitter, year, month);
+'''
+
+# maximum number of parameters in a single sqlite query
+_MAX_QUERY_PARAMS = 900
+
+
+def get_tweet_index_path(index_path=None):
+    """Gets path to the tweet index database.
+
+    :param index_path: path to the index, defaults to `data/interim/tweets_index.sqlite` in project path.
+    :return: path to the index.
+    """
+    if index_path is None:
+        index_path = os.path.join(config['DEFAULT']['project_path'], 'data', 'interim', 'tweets_index.sqlite')
+    return index_path
+
+
+def _get_timeline_path(path, twitter, year, month):
+    return jsonline.find_file(os.path.join(path, twitter, '{}-{:02}'.format(year, month)))
+
+
+class TweetIndex(object):
+    """On-disk index from tweet id to the location of the tweet."""
+
+    def __init__(self, path=None, index_path=None):
+        """Opens (or creates) the tweet index for the provided tweets directory.
+
+        :param path: path to the root directory containing tweets.
+        :param index_path: path to the index database.
+        """
+        if path is None:
+            path = os.path.join(config['DEFAULT']['project_path'], 'data', 'raw', 'tweets')
+        self.path = path
+        self.index_path = get_tweet_index_path(index_path)
+        index_dir = os.path.dirname(os.path.abspath(self.index_path))
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        self._conn = sqlite3.connect(self.index_path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        """Closes connection to the index database.
+
+        :return: None.
+        """
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def is_fresh(self, twitter, year, month):
+        """Checks whether the timeline file is indexed and unchanged since.
+
+        :param twitter: twitter handle of the timeline.
+        :param year: year of the timeline file.
+        :param month: month of the timeline file.
+        :return: True if the file is indexed and up-to-date.
+        """
+        row = self._conn.execute('SELECT size, mtime_ns FROM files WHERE twitter = ? AND year = ? AND month = ?',
+                                 (twitter, year, month)).fetchone()
+        if row is None:
+            return False
+        source = _get_timeline_path(self.path, twitter, year, month)
+        if not os.path.exists(source):
+            return False
+        stat = os.stat(source)
+        return tuple(row) == (stat.st_size, stat.st_mtime_ns)
+
+    def iter_file(self, twitter, year, month, decoder='auto'):
+        """Indexes a timeline file while returning its tweets.
+
+        Entries of the file are committed once the generator is exhausted.
+
+        :param twitter: twitter handle of the timeline.
+        :param year: year of the timeline file.
+        :param month: month of the timeline file.
+        :param decoder: JSON decoder backend, see `jsonline.get_decoder`.
+        :return: generator of tweets (dict) of the file.
+        """
+        source = _get_timeline_path(self.path, twitter, year, month)
+        stat = os.stat(source)
+        loads = jsonline.get_decoder(decoder)
+        entries = []
+        with jsonline.open_file(source) as fp:
+            offset = 0
+            for line in fp:
+                line_offset = offset
+                offset += len(line)
+                if len(line.strip()) == 0:
+                    continue
+                tweet = loads(line.strip())
+                entries.append((int(tweet['id']), twitter, year, month, line_offset, len(line)))
+                yield tweet
+        params = (twitter, year, month)
+        self._conn.execute('DELETE FROM tweets WHERE twitter = ? AND year = ? AND month = ?', params)
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO tweets (id, twitter, year, month, offset, length) VALUES (?, ?, ?, ?, ?, ?)',
+            entries
+        )
+        self._conn.execute('INSERT OR REPLACE INTO files (twitter, year, month, size, mtime_ns) '
+                           'VALUES (?, ?, ?, ?, ?)', params + (stat.st_size, stat.st_mtime_ns))
+        self._conn.commit()
+
+    def index_file(self, twitter, year, month, decoder='auto'):
+        """Indexes a timeline file.
+
+        :param twitter: twitter handle of the timeline.
+        :param year: year of the timeline file.
+        :param month: month of the timeline file.
+        :param decoder: JSON decoder backend, see `jsonline.get_decoder`.
+        :return: number of tweets indexed.
+        """
+        return sum(1 for _ in self.iter_file(twitter, year, month, decoder=decoder))
+
+    def remove_file(self, twitter, year, month):
+        """Removes the entries of a timeline file from the index.
+
+        :param twitter: twitter handle of the timeline.
+        :param year: year of the timeline file.
+        :param month: month of the timeline file.
+        :return: None.
+        """
+        params = (twitter, year, month)
+        self._conn.execute('DELETE FROM tweets WHERE twitter = ? AND year = ? AND month = ?', params)
+        self._conn.execute('DELETE FROM files WHERE twitter = ? AND year = ? AND month = ?', params)
+        self._conn.commit()
+
+    def lookup(self, ids):
+        """Gets the locations of tweets.
+
+        :param ids: tweet ids (int or str).
+        :return: mapping of tweet id (int) to (twitter, year, month, offset, length) for tweets in the index.
+        """
+        ids = [int(x) for x in ids]
+        result = {}
+        for i in range(0, len(ids), _MAX_QUERY_PARAMS):
+            chunk = ids[i:i + _MAX_QUERY_PARAMS]
+            sql = 'SELECT id, twitter, year, month, offset, length FROM tweets WHERE id IN ({})'.format(
+                ', '.join('?' for _ in chunk))
+            for row in self._conn.execute(sql, chunk):
+                result[row[0]] = tuple(row[1:])
+        return result
+
+
+def _read_plain(source, locations):
+    with open(source, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return [b'' for _ in locations]
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [mm[offset:offset + length] for offset, length in locations]
+
+
+def _read_blocks(source, index, locations):
+    offsets = [block[4] for block in index['blocks']]
+    lines, cached_block_id, data = [], None, b''
+    with open(source, 'rb') as fp:
+        for offset, length in locations:
+            block_id = bisect.bisect_right(offsets, offset) - 1
+            if block_id != cached_block_id:
+                data, cached_block_id = jsonline.read_block(fp, index['blocks'][block_id]), block_id
+            start = offset - offsets[block_id]
+            lines.append(data[start:start + length])
+    return lines
+
+
+def _read_stream(source, locations):
+    lines = []
+    with jsonline.open_file(source) as fp:
+        for offset, length in locations:
+            fp.seek(offset)
+            lines.append(fp.read(length))
+    return lines
+
+
+def _read_lines(source, locations):
+    _, ext = jsonline.split_extension(source)
+    if ext == '.jsonl':
+        return _read_plain(source, locations)
+    index = jsonline.load_block_index(source) if ext.endswith('.gz') else None
+    if index is not None:
+        return _read_blocks(source, index, locations)
+    return _read_stream(source, locations)
+
+
+def build_tweet_index(path=None, index_path=None, filters=None, overwrite=False, verbose=1):
+    """Builds (or updates) the tweet index for the timeline files.
+
+    Files that are indexed and unchanged are skipped unless `overwrite` is set.
+
+    :param path: path to the root directory containing tweets.
+    :param index_path: path to the index database.
+    :param filters: list of files metadata for indexing. Should be a dict with keys ['twitter', 'year', 'month'].
+    :param overwrite: whether to re-index files that are up-to-date.
+    :param verbose: whether to show progress bar.
+    :return: number of files indexed.
+    """
+    from src.corpus.twitter import load_availability
+    if path is None:
+        path = os.path.join(config['DEFAULT']['project_path'], 'data', 'raw', 'tweets')
+    if filters is None:
+        filters = load_availability(path=path)
+    if verbose:
+        filters = tqdm.tqdm(filters, desc='Indexing Tweets')
+    num_indexed = 0
+    with TweetIndex(path=path, index_path=index_path) as index:
+        for item in filters:
+            twitter, year, month = item['twitter'], item['year'], item['month']
+            if (not overwrite) and index.is_fresh(twitter, year, month):
+                continue
+            index.index_file(twitter, year, month)
+            num_indexed += 1
+    return num_indexed
+
+
+def get_tweets(ids, path=None, index_path=None, decoder=None):
+    """Gets tweets by id using the tweet index.
+
+    Files that changed since they were indexed are re-indexed before reading, files that were deleted are
+      removed from the index.
+
+    :param ids: tweet ids (int or str).
+    :param path: path to the root directory containing tweets.
+    :param index_path: path to the index database.
+    :param decoder: JSON decoder backend, see `jsonline.get_decoder`.
+    :return: list of tweets in the order of `ids`, None for tweets that are not in the index.
+    """
+    ids = [int(x) for x in ids]
+    loads = jsonline.get_decoder(decoder)
+    tweets = {}
+    with TweetIndex(path=path, index_path=index_path) as index:
+        locations = index.lookup(ids)
+        files = {}
+        for tweet_id, (twitter, year, month, offset, length) in locations.items():
+            files.setdefault((twitter, year, month), []).append((offset, length, tweet_id))
+        stale = [key for key in files if not index.is_fresh(*key)]
+        for key in stale:
+            if os.path.exists(_get_timeline_path(index.path, *key)):
+                index.index_file(*key)
+            else:
+                # tweets of deleted files are missing
+                index.remove_file(*key)
+        if stale:
+            locations = index.lookup([tweet_id for key in stale for _, _, tweet_id in files.pop(key)])
+            for tweet_id, (twitter, year, month, offset, length) in locations.items():
+                files.setdefault((twitter, year, month), []).append((offset, length, tweet_id))
+        for (twitter, year, month), entries in files.items():
+            entries.sort()
+            source = _get_timeline_path(index.path, twitter, year, month)
+            lines = _read_lines(source, [(offset, length) for offset, length, _ in entries])
+            for (_, _, tweet_id), line in zip(entries, lines):
+                tweet = loads(line.strip())
+                tweet['username'] = twitter
+                tweets[tweet_id] = tweet
+    return [tweets.get(tweet_id) for tweet_id in ids]
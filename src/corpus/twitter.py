@@ -4,38 +4,49 @@ There are three major functions.
 1. Data collection with TwitterAPI.
 2. Loading from local file system.
 """
+import collections
+import functools
+import json
 import os
 
 import tqdm
 
 from src.config import config
-from src.utils import jsonline
+from src.corpus import store
+from src.corpus.catalog import AvailabilityCatalog
+from src.utils import jsonline, parallel
 
 __all__ = [
     'load_availability',
     'load_tweets',
+    'load_lang_counts',
 ]
 
 
-def load_availability(path=None):
+def load_availability(path=None, catalog=None, refresh=True):
     """Returns a generator for loading tweets from filesystem.
 
     Note: depending on the size of the dataset it might not be a good idea to load full dataset to the memory.
 
     :param path: path to the root directory containing tweets.
+    :param catalog: `AvailabilityCatalog`, path to the catalog database or True for the default catalog.
+        If provided, availability is read from the catalog instead of listing all timeline directories.
+    :param refresh: whether to incrementally refresh the catalog before reading it.
     """
     if path is None:
         path = os.path.join(config['DEFAULT']['project_path'], 'data', 'raw', 'tweets')
+    if catalog is not None:
+        return _load_availability_from_catalog(path, catalog, refresh)
     values = set()
     usernames = os.listdir(path)
     for username in tqdm.tqdm(usernames, desc='Loading Availability'):
         timeline_fp = os.path.join(path, username)
         if os.path.isdir(timeline_fp):
             for fn in os.listdir(timeline_fp):
-                fn = str(fn)
-                if not fn.endswith('.jsonl'):
+                fn, ext = jsonline.split_extension(str(fn))
+                if (ext is None) or (ext.split('.')[1] != 'jsonl'):
                     continue
-                year, month = fn[:-6].split('-')
+                year, month = fn.split('-')
                 assert len(year) == 4, 'Year must be represented with four digits.'
                 assert len(month) == 2, 'Month must be represented with two digits with leading zeros if required.'
                 values.add((username, int(year), int(month)))
@@ -44,28 +55,140 @@ def load_availability(path=None):
     return result
 
 
-def load_tweets(path=None, filters=None, verbose=1):
+def _load_availability_from_catalog(path, catalog, refresh):
+    if isinstance(catalog, AvailabilityCatalog):
+        if refresh:
+            catalog.refresh()
+        entries = catalog.query()
+    else:
+        catalog_path = None if catalog is True else catalog
+        with AvailabilityCatalog(path=path, catalog_path=catalog_path) as catalog:
+            if refresh:
+                catalog.refresh(verbose=True)
+            entries = catalog.query()
+    keys = ('twitter', 'year', 'month')
+    return [{key: entry[key] for key in keys} for entry in entries]
+
+
+def _project(tweet, columns):
+    return {name: tweet.get(name) for name in columns}
+
+
+def _get_timeline_path(path, item):
+    fn = '{}-{:02}'.format(item['year'], item['month'])
+    return jsonline.find_file(os.path.join(path, item['twitter'], fn))
+
+
+def _iter_timeline(item, path, decoder=None, columns=None, store_path=None, use_store=False):
+    year, month = item['year'], item['month']
+    lang = item.get('lang', None)
+    twitter = item['twitter']
+    fp = _get_timeline_path(path, item)
+    partition = None
+    if store_path is not None:
+        partition = store.open_partition(store_path, twitter, year, month, source=fp)
+    if (lang is not None) and (partition is not None) and (partition.lang_counts is not None):
+        if partition.lang_counts.get(lang, 0) == 0:
+            # no tweets in this file can match the language filter
+            return
+    if use_store and (partition is not None):
+        for tweet in partition.iter_records(columns=columns, lang=lang):
+            tweet['username'] = twitter
+            yield tweet
+        return
+    # lines without the quoted language code cannot match the filter and are skipped before decoding
+    contains = json.dumps(lang) if lang is not None else None
+    for tweet in jsonline.load(fp, decoder=decoder, contains=contains):
+        if (lang is not None) and (tweet.get('lang') != lang):
+            continue
+        if columns is not None:
+            tweet = _project(tweet, columns)
+        tweet['username'] = twitter
+        yield tweet
+
+
+def _load_timeline(item, **kwargs):
+    return list(_iter_timeline(item, **kwargs))
+
+
+def load_tweets(path=None, filters=None, verbose=1, decoder=None, columns=None, store_path=None, catalog=None,
+                num_workers=0, prefetch=None, ordered=True, executor='thread'):
     """Returns a generator for loading tweets from filesystem.
 
     Note: depending on the size of the dataset it might not be a good idea to load full dataset to the memory.
 
+    When `columns` is provided and all of them are available in the columnar store (see `src.corpus.store`),
+      tweets are read from the up-to-date store partitions instead of parsing the raw timeline files.
+
+    When a filter has 'lang', files recorded in the store as having no tweets of that language are skipped and
+      lines of raw files that cannot match are skipped before JSON decoding.
+
+    When `num_workers` is set, files are read and decoded in a pool of workers. At most `prefetch` files are
+      held in memory at once irrespective of the number of files in `filters`.
+
     :param path: path to the root directory containing tweets.
     :param filters: list of files metadata for loading. Should be a dict with keys ['twitter', 'year', 'month'].
     :param verbose: whether to show progress bar.
+    :param decoder: JSON decoder backend used to parse tweets, see `jsonline.get_decoder`.
+    :param columns: list of fields to include in each tweet. Defaults to all fields of the raw tweet.
+    :param store_path: path to the root directory of the columnar store.
+    :param catalog: availability catalog used when `filters` is not provided, see `load_availability`.
+    :param num_workers: number of workers to read files with, 0 reads files sequentially in the calling thread.
+        None uses all CPUs, see `parallel.get_num_workers`.
+    :param prefetch: maximum number of files read ahead by workers. Defaults to twice the number of workers.
+    :param ordered: whether to return tweets in the same order as sequential loading.
+        If False tweets of each file are returned as soon as the file is read.
+    :param executor: type of pool to read files with {'thread', 'process'}.
     """
     if path is None:
         path = os.path.join(config['DEFAULT']['project_path'], 'data', 'raw', 'tweets')
     if filters is None:
-        filters = load_availability(path=path)
+        filters = load_availability(path=path, catalog=catalog)
+    store_path = store.get_store_path(store_path)
+    if not os.path.isdir(store_path):
+        store_path = None
+    use_store = False
+    if columns is not None:
+        columns = list(columns)
+        use_store = (store_path is not None) and all(c in store.STORE_COLUMNS for c in columns)
     if verbose:
         filters = tqdm.tqdm(filters, desc='Loading Documents')
+    kwargs = dict(path=path, decoder=decoder, columns=columns, store_path=store_path, use_store=use_store)
+    if num_workers == 0:
+        for item in filters:
+            yield from _iter_timeline(item, **kwargs)
+        return
+    func = functools.partial(_load_timeline, **kwargs)
+    for tweets in parallel.imap(func, filters, num_workers=num_workers, prefetch=prefetch, ordered=ordered,
+                                executor=executor):
+        yield from tweets
+
+
+def load_lang_counts(path=None, filters=None, store_path=None, decoder=None):
+    """Returns the number of tweets of each language in each timeline file.
+
+    Counts are read from the columnar store when the partition is up-to-date, otherwise the file is decoded.
+
+    :param path: path to the root directory containing tweets.
+    :param filters: list of files metadata. Should be a dict with keys ['twitter', 'year', 'month'].
+    :param store_path: path to the root directory of the columnar store.
+    :param decoder: JSON decoder backend used to parse tweets, see `jsonline.get_decoder`.
+    :return: list of dict with keys ['twitter', 'year', 'month', 'lang_counts'].
+    """
+    if path is None:
+        path = os.path.join(config['DEFAULT']['project_path'], 'data', 'raw', 'tweets')
+    if filters is None:
+        filters = load_availability(path=path)
+    store_path = store.get_store_path(store_path)
+    result = []
     for item in filters:
-        year, month = item['year'], item['month']
-        lang = item.get('lang', None)
-        fn = '{}-{:02}.{}'.format(year, month, 'jsonl')
-        twitter = item['twitter']
-        fp = os.path.join(path, twitter, fn)
-        for tweet in jsonline.load(fp):
-            tweet['username'] = twitter
-            if (lang is None) or (tweet.get('lang') == lang):
-                yield tweet
+        twitter, year, month = item['twitter'], item['year'], item['month']
+        fp = _get_timeline_path(path, item)
+        partition = store.open_partition(store_path, twitter, year, month, source=fp)
+        if (partition is not None) and (partition.lang_counts is not None):
+            lang_counts = dict(partition.lang_counts)
+        else:
+            counter = collections.Counter(tweet.get('lang') for tweet in jsonline.load(fp, decoder=decoder))
+            lang_counts = {lang: count for lang, count in counter.items() if lang is not None}
+        result.append({'twitter': twitter, 'year': year, 'month': month, 'lang_counts': lang_counts})
+    return result
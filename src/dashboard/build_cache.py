@@ -28,8 +28,9 @@ assert model_path == model_loader.path, 'Provided path does not match with the d
 
 
 def _rebuild_topics_cache():
-    filtered_documents = filter_documents(docs=load_documents(verbose=True), verbose=True)
-    prepared_documents = model_loader.model.preprocess(filtered_documents)
+    docs = load_documents(verbose=True, num_workers=None, token_cache=True)
+    filtered_documents = filter_documents(docs=docs, verbose=True)
+    prepared_documents = model_loader.model.preprocess(filtered_documents, return_type='sparse')
     prepared_topic_vis = prepare_topics(topic_model=model_loader.model, documents=prepared_documents)
     cache.set('prepared_topic_vis', prepared_topic_vis)
     #
@@ -54,7 +54,7 @@ class TopicModelLoader(db.Model):
 
         :return: TopicModel
         """
-        if (not hasattr(self, '_topic_model')) or (self._topic_model_ is None):
+        if (not hasattr(self, '_topic_model_')) or (self._topic_model_ is None):
             self.load()
         return self._topic_model_
 
@@ -66,7 +66,7 @@ class TopicModelLoader(db.Model):
 
         :return: `TopicModel`
         """
-        if not hasattr(self, '_topic_model'):
+        if not hasattr(self, '_topic_model_'):
             self._topic_model_ = None
         if self._topic_model_ is None:
             # noinspection PyAttributeOutsideInit
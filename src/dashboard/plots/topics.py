@@ -89,12 +89,17 @@ def prepare_topics(topic_model, documents):
     """Computes the topic visualization parameters for the provided documents.
 
     :param topic_model: Topic Model Builder.
-    :param documents: Documents or preprocessed documents output.
-    :return: self
+    :param documents: Documents, preprocessed documents output or `RaggedCorpus`. Documents are preprocessed
+        into a `Sparse2Corpus` so that the term-document matrix is only built once.
+    :return: dict of the pyLDAvis parameters ['topic_term_dists', 'doc_topic_dists', 'doc_lengths', 'vocab',
+        'term_frequency'].
     """
-    corpus, _, _, _, _ = topic_model.preprocess(documents)
+    corpus, _, _, _, _ = topic_model.preprocess(documents, return_type='sparse')
     _corpus = corpus
-    if not gensim.matutils.ismatrix(corpus):
+    if isinstance(corpus, gensim.matutils.Sparse2Corpus):
+        # term-document matrix the corpus was built from
+        corpus_csc = corpus.sparse
+    elif not gensim.matutils.ismatrix(corpus):
         corpus_csc = gensim.matutils.corpus2csc(corpus, num_terms=len(topic_model.dictionary))
     else:
         corpus_csc = corpus
@@ -7,11 +7,14 @@ from dateutil.relativedelta import relativedelta
 import pandas as pd
 from sqlalchemy.exc import NoResultFound
 
-from src.corpus import load_tweets
+from src.corpus import load_tweets, TokenCache
 from src.dataset import load_dataset
 from src.dashboard.models import db, Topic, TopicModelLoader, Collection
 from src.models import list_topic_models, format_topic_model_name, get_topic_model_path
 
+# fields of tweets used when importing documents
+TWEET_COLUMNS = ['id', 'text', 'created_at']
+
 
 def _register_models():
     from src.dashboard import models
@@ -136,7 +139,7 @@ def _import_collections_intra(app, verbose=False):
                 )
                 db.session.add(collection_1)
                 document_ids = set()
-                for tweet in load_tweets(filters=before_months, verbose=0):
+                for tweet in load_tweets(filters=before_months, verbose=0, columns=TWEET_COLUMNS):
                     tweet_id = int(tweet['id'])
                     tweet_text = tweet['text']
                     tweet_created_at = datetime.datetime.strptime(tweet['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
@@ -152,7 +155,7 @@ def _import_collections_intra(app, verbose=False):
                 )
                 db.session.add(collection_2)
                 document_ids = set()
-                for tweet in load_tweets(filters=after_months, verbose=0):
+                for tweet in load_tweets(filters=after_months, verbose=0, columns=TWEET_COLUMNS):
                     tweet_id = int(tweet['id'])
                     tweet_text = tweet['text']
                     tweet_created_at = datetime.datetime.strptime(tweet['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
@@ -193,7 +196,7 @@ def _import_collections_inter(app, verbose=False):
                 )
                 db.session.add(c)
                 document_ids = set()
-                for tweet in load_tweets(filters=filters, verbose=0):
+                for tweet in load_tweets(filters=filters, verbose=0, columns=TWEET_COLUMNS):
                     tweet_id = int(tweet['id'])
                     tweet_text = tweet['text']
                     tweet_created_at = datetime.datetime.strptime(tweet['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
@@ -260,7 +263,7 @@ def _import_collections_intra_consistency(app, verbose=False):
                     )
                     db.session.add(collection_1)
                     document_ids = set()
-                    for tweet in load_tweets(filters=[month], verbose=0):
+                    for tweet in load_tweets(filters=[month], verbose=0, columns=TWEET_COLUMNS):
                         tweet_id = int(tweet['id'])
                         tweet_text = tweet['text']
                         tweet_created_at = datetime.datetime.strptime(tweet['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
@@ -278,7 +281,7 @@ def _import_collections_intra_consistency(app, verbose=False):
                     )
                     db.session.add(collection_2)
                     document_ids = set()
-                    for tweet in load_tweets(filters=[month], verbose=0):
+                    for tweet in load_tweets(filters=[month], verbose=0, columns=TWEET_COLUMNS):
                         tweet_id = int(tweet['id'])
                         tweet_text = tweet['text']
                         tweet_created_at = datetime.datetime.strptime(tweet['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
@@ -321,7 +324,7 @@ def _import_collections_inter_consistency(app, verbose=False):
                     )
                     db.session.add(c)
                     document_ids = set()
-                    for tweet in load_tweets(filters=[_filter], verbose=0):
+                    for tweet in load_tweets(filters=[_filter], verbose=0, columns=TWEET_COLUMNS):
                         tweet_id = int(tweet['id'])
                         tweet_text = tweet['text']
                         tweet_created_at = datetime.datetime.strptime(tweet['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
@@ -343,30 +346,36 @@ def _update_collection_topic_dist(app, num_epochs=1, num_topics=6):
         for model_loader in TopicModelLoader.query.all():
             if (model_loader.model.num_epochs, model_loader.model.num_topics) == (num_epochs, num_topics):
                 break
-        collections = Collection.query.all()
-        for c in tqdm.tqdm(collections, desc='Inferring Author Topic Probabilities'):
+        else:
+            model_loader = None
+        if model_loader is None:
+            raise ValueError('No topic model found with {} epochs and {} topics.'.format(num_epochs, num_topics))
+        model = model_loader.model
+        collections = []
+        for c in Collection.query.all():
             try:
                 _ = c.get_topic_dist(model_loader)
             except NoResultFound as ex:
-                topic_dist = None
-                if len(c.documents) == 0:
-                    topic_dist = [0.0 for _ in range(model_loader.model.num_topics)]
-                if topic_dist is None:
-                    processed_docs = model_loader.model.preprocess(c.documents)
-                    topic_dist = model_loader.model.get_new_author_topics(processed_docs)
-                if len(topic_dist) != model_loader.model.num_topics:
-                    msg_fmt = 'Invalid number of topics. Found {} expected {}.'
-                    msg = msg_fmt.format(len(topic_dist), model_loader.model.num_topics)
-                    raise ValueError(msg)
-                for i, proba in enumerate(topic_dist):
-                    topic = model_loader.topics[i]
-                    assert topic.index == i, 'invalid index access.'
-                    try:
-                        _ = c.get_topic_proba(topic)
-                    except NoResultFound as ex:
-                        c.set_topic_proba(topic=topic, proba=proba)
-                db.session.commit()
-                _ = c.get_topic_dist(model_loader)
+                collections.append(c)
+        # collections are folded in as new authors at once
+        with TokenCache() as token_cache:
+            topic_dists = model.infer_authors({i: c.documents for i, c in enumerate(collections)},
+                                              token_cache=token_cache)
+        model_num_topics, topics = model.num_topics, model_loader.topics
+        for c, topic_dist in zip(tqdm.tqdm(collections, desc='Saving Author Topic Probabilities'), topic_dists):
+            if len(topic_dist) != num_topics:
+                msg_fmt = 'Invalid number of topics. Found {} expected {} (model has {}).'
+                msg = msg_fmt.format(len(topic_dist), num_topics, model_num_topics)
+                raise ValueError(msg)
+            for i, proba in enumerate(topic_dist.tolist()):
+                topic = topics[i]
+                assert topic.index == i, 'invalid index access.'
+                try:
+                    _ = c.get_topic_proba(topic)
+                except NoResultFound as ex:
+                    c.set_topic_proba(topic=topic, proba=proba)
+            db.session.commit()
+            _ = c.get_topic_dist(model_loader)
 
 
 def init_db(reset=False):
@@ -26,20 +26,46 @@ __all__ = [
 from src.errors import ValidationError
 
 
+COLUMNS = ['subject_id', 'name', 'position', 'participant', 'event_id', 'event_type', 'datetime', 'twitter']
+
+CATEGORICAL_COLUMNS = ['position', 'event_type']
+
+# cache of loaded datasets, see `load_dataset`
+_dataset_cache = {}
+
+
+def _hash_text(text):
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:10], 16)
+
+
 def _build_id(*args):
     col = args[0].replace(' ', '_', regex=True)
     for rows in args[1:]:
         col += '_' + rows.replace(' ', '_', regex=True)
-    col = col.str.encode('utf-8')
-    hash_ids = []
-    hash_id2text = {}
-    for text in col:
-        hash_id = int(hashlib.sha1(text).hexdigest()[:10], 16)
-        if (hash_id in hash_id2text) and (hash_id2text[hash_id] != text):
-            raise BufferError
-        hash_id2text[hash_id] = text
-        hash_ids.append(hash_id)
-    return hash_ids
+    # hash each distinct value once
+    unique_texts = pd.Series(col.dropna().unique(), dtype=object)
+    unique_ids = pd.Series([_hash_text(text) for text in unique_texts], index=unique_texts.values, dtype=np.int64)
+    if unique_ids.duplicated().any():
+        raise BufferError
+    return col.map(unique_ids).to_numpy()
+
+
+def _clean_twitter(col):
+    return col.str.replace(u'\u200f', '').str.strip().str.replace(r'(^@+)|([,.]+$)', '', regex=True)
+
+
+def _select_valid(df):
+    valid_idx = df['twitter'].str.match(r'^[A-Za-z0-9_]+$').astype(bool)
+    df.loc[~valid_idx, ['twitter']] = np.nan
+    return df[COLUMNS] \
+        .dropna(subset=['twitter']) \
+        .drop_duplicates(subset=['subject_id', 'twitter']) \
+        .reset_index(drop=True)
+
+
+def _assign_event_id(df):
+    df = df.assign(event_id=_build_id(df['datetime'].astype(str), df['event_type']))
+    return df.assign(event_id=df['event_id'].fillna(-1).astype(int))
 
 
 def _load_participants(path=None):
@@ -56,18 +82,10 @@ def _load_participants(path=None):
         subject_id=_build_id(df['first_name'], df['last_name']),
         name=df['first_name'] + ' ' + df['last_name'],
         datetime=pd.to_datetime(df['join_date']),
-        twitter=df['twitter'].str.replace(u'\u200f', '').str.strip().str.replace(r'(^@+)|([,.]+$)', '', regex=True),
+        twitter=_clean_twitter(df['twitter']),
         event_type='Joined'
     )
-    df = df.assign(event_id=_build_id(df['datetime'].astype(str), df['event_type']))
-    df = df.assign(event_id=df['event_id'].fillna(-1).astype(int))
-    valid_idx = df['twitter'].str.match(r'^[A-Za-z0-9_]+$').astype(bool)
-    df.loc[~valid_idx, ['twitter']] = np.nan
-    columns = ['subject_id', 'name', 'position', 'participant', 'event_id', 'event_type', 'datetime', 'twitter']
-    return df[columns] \
-        .dropna(subset=['twitter']) \
-        .drop_duplicates(subset=['subject_id', 'twitter']) \
-        .reset_index(drop=True)
+    return _select_valid(_assign_event_id(df))
 
 
 def _load_workshops(path=None):
@@ -89,18 +107,10 @@ def _load_workshops(path=None):
         subject_id=_build_id(df['first_name'], df['last_name']),
         name=df['first_name'] + ' ' + df['last_name'],
         datetime=pd.to_datetime(df['First day postworkshop']),
-        twitter=df['twitter'].str.replace(u'\u200f', '').str.strip().str.replace(r'(^@+)|([,.]+$)', '', regex=True),
+        twitter=_clean_twitter(df['twitter']),
         event_type='Workshop',
     )
-    df = df.assign(event_id=_build_id(df['datetime'].astype(str), df['event_type']))
-    df = df.assign(event_id=df['event_id'].fillna(-1).astype(int))
-    valid_idx = df['twitter'].str.match(r'^[A-Za-z0-9_]+$').astype(bool)
-    df.loc[~valid_idx, ['twitter']] = np.nan
-    columns = ['subject_id', 'name', 'position', 'participant', 'event_id', 'event_type', 'datetime', 'twitter']
-    return df[columns] \
-        .dropna(subset=['twitter']) \
-        .drop_duplicates(subset=['subject_id', 'twitter']) \
-        .reset_index(drop=True)
+    return _select_valid(_assign_event_id(df))
 
 
 def _load_weathercasters(path=None):
@@ -112,18 +122,12 @@ def _load_weathercasters(path=None):
         subject_id=_build_id(df['name']),
         event_id=-1,
         event_type=np.nan,
-        twitter=df['twitter'].str.replace(u'\u200f', '').str.strip().str.replace(r'(^@+)|([,.]+$)', '', regex=True),
+        twitter=_clean_twitter(df['twitter']),
         datetime=np.nan,
         position='Meteorologist',
         participant=np.nan,
     )
-    valid_idx = df['twitter'].str.match(r'^[A-Za-z0-9_]+$').astype(bool)
-    df.loc[~valid_idx, ['twitter']] = np.nan
-    columns = ['subject_id', 'name', 'position', 'participant', 'event_id', 'event_type', 'datetime', 'twitter']
-    return df[columns] \
-        .dropna(subset=['twitter']) \
-        .drop_duplicates(subset=['subject_id', 'twitter']) \
-        .reset_index(drop=True)
+    return _select_valid(df)
 
 
 def _not_duplicated(df, raise_error=True):
@@ -136,18 +140,27 @@ def _not_duplicated(df, raise_error=True):
     return True
 
 
-def load_dataset(path=None):
-    """Loads the dataset containing the records.
+def _get_paths(path=None):
+    if path is None:
+        path = os.path.join(config['DEFAULT']['project_path'], 'data', 'external')
+    return (
+        os.path.join(path, 'Local and National CM CMN list May 2021.csv'),
+        os.path.join(path, 'Workshop Attendees - Version 1.csv'),
+        os.path.join(path, 'Wx Twitter Handles - Version 1.csv'),
+    )
 
-    :param path: path to the root directory with files to load.
-    :return: `pandas.DataFrame` with required fields for analysis.
-    """
-    if path is not None:
-        path_1 = os.path.join(path, 'Local and National CM CMN list May 2021.csv')
-        path_2 = os.path.join(path, 'Workshop Attendees - Version 1.csv')
-        path_3 = os.path.join(path, 'Wx Twitter Handles - Version 1.csv')
-    else:
-        path_1, path_2, path_3 = None, None, None
+
+def _get_content_key(paths):
+    sha1 = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as fp:
+            sha1.update(fp.read())
+        sha1.update(b'\0')
+    return sha1.hexdigest()
+
+
+def _load_dataset(paths):
+    path_1, path_2, path_3 = paths
     df_1 = _load_participants(path_1)
     _not_duplicated(df_1)
     df_2 = _load_workshops(path_2)
@@ -161,5 +174,29 @@ def load_dataset(path=None):
         .drop_duplicates(subset=['subject_id', 'twitter', 'event_id'], keep='first') \
         .reset_index(drop=True)
     df = df.assign(participant=df['subject_id'].isin(df_c['subject_id']))
-    columns = ['subject_id', 'name', 'position', 'participant', 'event_id', 'event_type', 'datetime', 'twitter']
-    return df[columns]
+    df = df.astype({column: 'category' for column in CATEGORICAL_COLUMNS})
+    return df[COLUMNS]
+
+
+def load_dataset(path=None, use_cache=True):
+    """Loads the dataset containing the records.
+
+    Loaded datasets are cached in memory keyed by the modification time, size and contents of the source files,
+      so repeated calls with unchanged files return a copy of the cached dataset.
+
+    :param path: path to the root directory with files to load.
+    :param use_cache: whether to use the in-memory cache.
+    :return: `pandas.DataFrame` with required fields for analysis.
+    """
+    paths = _get_paths(path)
+    if not use_cache:
+        return _load_dataset(paths)
+    stat_key = tuple((os.path.abspath(p), os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in paths)
+    if stat_key not in _dataset_cache:
+        content_key = _get_content_key(paths)
+        if content_key not in _dataset_cache:
+            # sources changed, drop datasets of previous versions
+            _dataset_cache.clear()
+            _dataset_cache[content_key] = _load_dataset(paths)
+        _dataset_cache[stat_key] = _dataset_cache[content_key]
+    return _dataset_cache[stat_key].copy()
@@ -21,7 +21,17 @@ class JSONLineDecodeError(Exception):
 
     Raise when there is an error in reading a JSON line file. Analogous to  `json.JSONDecodeError`.
 
+    Attributes
+    ----------
+    lineno : The line number (starting from 1) of the line that failed to decode.
+    offset : The byte offset of the start of that line in the file.
+
     See Also
     --------
     jsonline.load : Loads jsonline file into a dict.
     """
+
+    def __init__(self, msg, lineno=None, offset=None):
+        super(JSONLineDecodeError, self).__init__(msg)
+        self.lineno = lineno
+        self.offset = offset
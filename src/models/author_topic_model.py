@@ -5,14 +5,19 @@ import logging
 
 import numpy as np
 import pandas as pd
+import scipy.sparse
+from gensim.corpora import Dictionary
 from gensim.models import AuthorTopicModel as GensimAuthorTopicModel, Phrases, CoherenceModel
 from gensim.test.utils import temporary_file
 import tqdm
 
 from src.models.callbacks import CallbackList
+from src.models.inference import fold_in_authors, infer_gamma, iter_bow_batches
 from src.models.topic_model import TopicModel
+from src.preprocessing.corpus import RaggedCorpus
 from src.preprocessing.documents import preprocess_documents
 from src.preprocessing.keywords import create_eta
+from src.preprocessing.vocabulary import format_model_memory
 
 __all__ = [
     'AuthorTopicModel',
@@ -32,7 +37,7 @@ class AuthorTopicModel(TopicModel):
     """
 
     def __init__(self, num_topics, passes=1, iterations=1, keywords=None, phrases_model=None,
-                 callbacks=None, verbose=False):
+                 callbacks=None, verbose=False, token_cache=None, min_df=0, max_df=1.0, keep_n=None):
         super(AuthorTopicModel, self).__init__()
         self.num_topics = num_topics
         self.num_epochs = passes
@@ -41,13 +46,17 @@ class AuthorTopicModel(TopicModel):
         self.phrases_model = phrases_model
         self.verbose = verbose
         self.callbacks = callbacks
+        self.token_cache = token_cache
+        self.min_df = min_df
+        self.max_df = max_df
+        self.keep_n = keep_n
         self._base_model = None
         self._current_epoch = 0
 
     def _get_iter(self, items, desc=None):
         if self.verbose:
             return tqdm.tqdm(items, desc=desc)
-        return self.verbose
+        return items
 
     def _get_callbacks(self):
         callbacks = []
@@ -70,7 +79,12 @@ class AuthorTopicModel(TopicModel):
         self.phrases_model = phrases_model
         self._current_epoch = 0
         epoch = 1
-        eta = create_eta(self.keywords, dictionary, self.num_topics, len(corpus) // 100, normalize=True)
+        eta = create_eta(self.keywords, dictionary, self.num_topics, len(corpus) // 100, normalize=True, sparse=True)
+        # gensim's author-topic model only supports float64
+        memory = format_model_memory(len(dictionary), self.num_topics, num_authors=len(author2doc), dtype=np.float64)
+        logger.info(memory)
+        if self.verbose:
+            print(memory)
         callbacks = self._get_callbacks()
         with temporary_file('serialized') as s_path:
             callbacks.on_epoch_start(epoch=epoch)
@@ -81,7 +95,8 @@ class AuthorTopicModel(TopicModel):
                 iterations=self.iterations,
                 id2word=dictionary,
                 num_topics=self.num_topics,
-                eta=eta,
+                # gensim requires the dense prior, so fitting needs the memory of the dense matrix
+                eta=eta.toarray(dtype=np.float64),
                 serialized=True,
                 serialization_path=s_path,
                 eval_every=None, )
@@ -99,18 +114,41 @@ class AuthorTopicModel(TopicModel):
                 epoch += 1
         return self
 
-    def transform(self, docs):
+    def transform(self, docs, batch_size=2000, sparse=False, minimum_probability=None):
         """Infer the topics for the provided documents.
 
+        Each document is inferred as the only document of a new author, as in `get_new_author_topics`, for
+          batches of documents at once (see `src.models.inference.infer_gamma`).
+
         :param docs: documents to extract the topics.
-        :return: topic probability matrix.
+        :param batch_size: number of documents inferred at once.
+        :param sparse: whether to return a `scipy.sparse.csr_matrix` without the topic probabilities below
+            `minimum_probability`.
+        :param minimum_probability: minimum topic probability of the sparse matrix, defaults to the minimum
+            probability of the model.
+        :return: topic probability matrix of shape (num_docs, num_topics).
         """
-        corpus, _, _, _, _ = self.preprocess(docs)
+        corpus, _, _, _, _ = self.preprocess(
+            docs, return_type='sparse' if isinstance(self.dictionary, Dictionary) else 'tuple')
+        base_model = self._base_model
+        rho = pow(base_model.offset + 1 + 1, -base_model.decay)
         output = []
-        for i in self._get_iter(range(len(corpus)), desc='Inferring the Document Topic Probabilities'):
-            topic_proba = self._base_model.get_new_author_topics(corpus[i:i + 1])
-            output.append(list(zip(*topic_proba))[1])
-        return np.array(output)
+        batches = iter_bow_batches(corpus, base_model.num_terms, batch_size=batch_size)
+        if self.verbose:
+            batches = tqdm.tqdm(batches, desc='Inferring the Document Topic Probabilities', unit='batches')
+        for counts in batches:
+            # same initial topics of new authors as `get_new_author_topics`
+            gamma = base_model.random_state.gamma(100., 1. / 100., (counts.shape[0], self.num_topics))
+            gamma = infer_gamma(counts, gamma, base_model.expElogbeta, base_model.alpha, rho,
+                                base_model.iterations, base_model.gamma_threshold)
+            output.append(gamma / gamma.sum(axis=1)[:, None])
+        output = np.concatenate(output) if output else np.zeros((0, self.num_topics))
+        if sparse:
+            if minimum_probability is None:
+                minimum_probability = base_model.minimum_probability
+            output[output < max(minimum_probability, 1e-8)] = 0
+            return scipy.sparse.csr_matrix(output)
+        return output
 
     @property
     def corpus(self):
@@ -258,11 +296,54 @@ class AuthorTopicModel(TopicModel):
         # defaults to numpy array
         return topic_proba.iloc[:, 0].to_numpy()
 
-    def preprocess(self, docs):
+    def infer_authors(self, authors, minimum_probability=None, return_type=None, token_cache=None):
+        """Gets the topic distributions of new authors based on their documents.
+
+        Authors are inferred as with `get_new_author_topics`, all at once with a single gamma block
+          (see `src.models.inference.fold_in_authors`). The model is not modified.
+
+        :param authors: mapping of author names to lists of documents. Authors without documents get zero
+            probabilities.
+        :param minimum_probability: topic probabilities below this value are set to zero, defaults to the minimum
+            probability of the model.
+        :param return_type: return type [np.ndarray, pd.DataFrame, None] the data frame is indexed by author name.
+        :param token_cache: `TokenCache` to tokenize the documents with, defaults to the token cache of the model.
+        :return: topic probabilities of shape (num_authors, num_topics) in the order of `authors`.
+        """
+        names = list(authors.keys())
+        docs, doc_authors = [], []
+        for i, name in enumerate(names):
+            author_docs = list(authors[name])
+            docs.extend(author_docs)
+            doc_authors.extend(i for _ in author_docs)
+        base_model = self._base_model
+        # same initial topics of new authors as `get_new_author_topics`
+        gamma = base_model.random_state.gamma(100., 1. / 100., (len(names), self.num_topics))
+        if docs:
+            corpus, _, _, _, _ = self.preprocess(
+                docs, return_type='sparse' if isinstance(self.dictionary, Dictionary) else 'tuple',
+                token_cache=token_cache)
+            counts = scipy.sparse.vstack(list(iter_bow_batches(corpus, base_model.num_terms)), format='csr')
+            rho = pow(base_model.offset + 1 + 1, -base_model.decay)
+            gamma = fold_in_authors(counts, doc_authors, gamma, base_model.expElogbeta, base_model.alpha, rho,
+                                    base_model.iterations, base_model.gamma_threshold)
+        topic_proba = gamma / gamma.sum(axis=1)[:, None]
+        if minimum_probability is None:
+            minimum_probability = base_model.minimum_probability
+        topic_proba[topic_proba < max(minimum_probability, 1e-8)] = 0.0
+        topic_proba[np.bincount(doc_authors, minlength=len(names)) == 0] = 0.0
+        if return_type == pd.DataFrame:
+            return pd.DataFrame(topic_proba, index=names)
+        return topic_proba
+
+    def preprocess(self, docs, return_type='tuple', token_cache=None):
         """Run default preprocessing on docs if required.
 
         :param docs: list[Document]
-            Documents or processed docs. If already processed nothing to do.
+            Documents or processed docs (dict, tuple or `RaggedCorpus`). If already processed nothing to do.
+        :param return_type: {'tuple', 'sparse'} 'sparse' preprocesses documents into a `Sparse2Corpus` view of
+            a term-document matrix, see `preprocess_documents`.
+        :param token_cache: `TokenCache` to tokenize the documents with, defaults to the token cache of the model.
         :return: tuple of (corpus, author2doc, tokenized_docs, dictionary, phrases_model)
             Processed data.
         """
@@ -275,10 +356,17 @@ class AuthorTopicModel(TopicModel):
             return corpus, author2doc, tokenized_docs, dictionary, phrases_model
         elif isinstance(docs, tuple):
             return docs
+        elif isinstance(docs, RaggedCorpus):
+            return docs.to_tuple(sparse=return_type == 'sparse')
         else:
+            # dictionary is created (and pruned) from the documents before the model is trained
+            fitted = self._base_model is not None
             return preprocess_documents(
-                docs, phrases_model=self.phrases_model, dictionary=self.dictionary,
-                author2doc=self.author2doc, verbose=self.verbose,
+                docs, return_type=return_type, phrases_model=self.phrases_model,
+                dictionary=self.dictionary if fitted else None,
+                author2doc=self.author2doc if fitted else None, verbose=self.verbose,
+                token_cache=self.token_cache if token_cache is None else token_cache,
+                min_df=self.min_df, max_df=self.max_df, keep_n=self.keep_n, keywords=self.keywords,
             )
 
     def save(self, path):
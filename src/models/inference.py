@@ -0,0 +1,116 @@
+"""Vectorized inference of author topics for batches of documents.
+
+Gensim's `AuthorTopicModel.inference` updates the topics (gamma) of authors one document at a time. The
+  functions here run the same E-step updates for a batch of (author, document) pairs at once, with the
+  bag of words of the batch as a sparse matrix, so that new documents can be inferred without a Python loop
+  over documents.
+"""
+import numpy as np
+import scipy.sparse
+from gensim.matutils import Sparse2Corpus, corpus2csc, dirichlet_expectation
+
+__all__ = [
+    'iter_bow_batches',
+    'infer_gamma',
+    'fold_in_authors',
+]
+
+
+def iter_bow_batches(corpus, num_terms, batch_size=2000):
+    """Iterates over batches of documents as document-term matrices.
+
+    :param corpus: bag of words of documents, a `Sparse2Corpus` is sliced without conversion.
+    :param num_terms: number of terms.
+    :param batch_size: number of documents in each batch.
+    :return: generator of `scipy.sparse.csr_matrix` of shape (batch_size, num_terms).
+    """
+    if isinstance(corpus, Sparse2Corpus):
+        for start in range(0, len(corpus), batch_size):
+            yield corpus.sparse[:, start:start + batch_size].T.tocsr().astype(np.float64)
+        return
+    batch = []
+    for doc in corpus:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            yield corpus2csc(batch, num_terms=num_terms, num_docs=len(batch), dtype=np.float64).T.tocsr()
+            batch = []
+    if batch:
+        yield corpus2csc(batch, num_terms=num_terms, num_docs=len(batch), dtype=np.float64).T.tocsr()
+
+
+def _get_phinorm(exp_elog_theta, exp_elog_beta, rows, cols):
+    # normalizing constant of phi of each word of each document
+    return np.einsum('ij,ji->i', exp_elog_theta[rows], exp_elog_beta[:, cols]) + 1e-100
+
+
+def infer_gamma(counts, gamma, exp_elog_beta, alpha, rho, iterations, gamma_threshold, num_author_docs=1):
+    """Updates the topics of authors with one document each, see `gensim.models.AuthorTopicModel.inference`.
+
+    Each row is iterated until the mean change of its gamma is below `gamma_threshold`, as in gensim.
+
+    :param counts: document-term matrix (`scipy.sparse.csr_matrix`), row i is a document of author i.
+    :param gamma: topics of the authors before the update, array of shape (num_rows, num_topics).
+    :param exp_elog_beta: expected topic-term distribution of the model (`model.expElogbeta`).
+    :param alpha: document-topic prior of the model.
+    :param rho: weight of the update.
+    :param iterations: maximum number of iterations.
+    :param gamma_threshold: threshold of the mean change of gamma to stop iterating.
+    :param num_author_docs: number of documents of each author (int or array of shape (num_rows,)).
+    :return: updated gamma, array of shape (num_rows, num_topics).
+    """
+    counts = scipy.sparse.csr_matrix(counts)
+    num_author_docs = np.broadcast_to(np.asarray(num_author_docs, dtype=np.float64), (counts.shape[0],))
+    tilde_gamma = np.array(gamma, dtype=np.float64)
+    active = np.arange(counts.shape[0])
+    for _ in range(iterations):
+        if len(active) == 0:
+            break
+        batch = counts[active]
+        rows = np.repeat(np.arange(len(active)), np.diff(batch.indptr))
+        last_gamma = tilde_gamma[active]
+        exp_elog_theta = np.exp(dirichlet_expectation(last_gamma))
+        phinorm = _get_phinorm(exp_elog_theta, exp_elog_beta, rows, batch.indices)
+        # phi is computed implicitly as in gensim
+        scaled = scipy.sparse.csr_matrix((batch.data / phinorm, batch.indices, batch.indptr), shape=batch.shape)
+        dot = np.asarray(scaled @ exp_elog_beta.T)
+        updated = alpha + num_author_docs[active, None] * exp_elog_theta * dot
+        # interpolation between the "local" and "global" gamma
+        updated = (1 - rho) * gamma[active] + rho * updated
+        tilde_gamma[active] = updated
+        mean_change = np.abs(updated - last_gamma).mean(axis=1)
+        active = active[mean_change >= gamma_threshold]
+    return tilde_gamma
+
+
+def fold_in_authors(counts, doc_authors, gamma, exp_elog_beta, alpha, rho, iterations, gamma_threshold):
+    """Infers the topics of new authors from their documents, see `gensim.models.AuthorTopicModel.inference`.
+
+    Gensim updates the topics of an author after each of its documents in turn. Here the i-th documents of
+      all authors are updated at once with `infer_gamma`, so the number of steps is the maximum number of
+      documents of an author rather than the number of documents.
+
+    :param counts: document-term matrix (`scipy.sparse.csr_matrix`) of the documents of all authors.
+    :param doc_authors: author index of each document (int array), documents of an author are inferred in order.
+    :param gamma: initial topics of the authors, array of shape (num_authors, num_topics).
+    :param exp_elog_beta: expected topic-term distribution of the model (`model.expElogbeta`).
+    :param alpha: document-topic prior of the model.
+    :param rho: weight of the update.
+    :param iterations: maximum number of iterations.
+    :param gamma_threshold: threshold of the mean change of gamma to stop iterating.
+    :return: topics of the authors, array of shape (num_authors, num_topics).
+    """
+    counts = scipy.sparse.csr_matrix(counts)
+    doc_authors = np.asarray(doc_authors, dtype=np.int64)
+    gamma = np.array(gamma, dtype=np.float64)
+    num_author_docs = np.bincount(doc_authors, minlength=len(gamma))
+    # rank of each document among the documents of its author
+    order = np.argsort(doc_authors, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(num_author_docs)[:-1]])
+    ranks = np.empty(len(doc_authors), dtype=np.int64)
+    ranks[order] = np.arange(len(doc_authors)) - starts[doc_authors[order]]
+    order = np.argsort(ranks, kind='stable')
+    for docs in np.split(order, np.cumsum(np.bincount(ranks))[:-1]):
+        authors = doc_authors[docs]
+        gamma[authors] = infer_gamma(counts[docs], gamma[authors], exp_elog_beta, alpha, rho, iterations,
+                                     gamma_threshold, num_author_docs=num_author_docs[authors])
+    return gamma
@@ -0,0 +1,161 @@
+"""Parallel inference of new authors with the model arrays shared by all workers.
+
+The arrays used by inference (the expected topic-term distribution `expElogbeta` and the prior `alpha`) are
+  saved once to `.npy` files that workers memory-map read-only, so all workers share the same pages instead
+  of unpickling a copy of the model each. Workers get the dictionary and phrase model once when they start,
+  preprocess the documents of their authors and fold them in with `src.models.inference.fold_in_authors`.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from gensim.corpora import Dictionary
+
+from src.models.inference import fold_in_authors, iter_bow_batches
+from src.utils import parallel
+
+__all__ = [
+    'ParallelInference',
+    'get_balanced_chunks',
+]
+
+_ARRAYS = ['expElogbeta', 'alpha']
+
+# state of worker processes, set by `_init_worker`
+_worker_state = None
+
+
+def get_balanced_chunks(sizes, num_chunks):
+    """Splits items into chunks of about the same total size.
+
+    Items are assigned from the largest to the chunk with the smallest total size so far.
+
+    :param sizes: size of each item (e.g., number of documents of each author).
+    :param num_chunks: number of chunks.
+    :return: list of non-empty arrays of item indices, in ascending order within each chunk.
+    """
+    sizes = np.asarray(sizes)
+    num_chunks = max(1, min(num_chunks, len(sizes)))
+    totals = np.zeros(num_chunks)
+    chunks = [[] for _ in range(num_chunks)]
+    for i in np.argsort(-sizes, kind='stable').tolist():
+        j = int(np.argmin(totals))
+        chunks[j].append(i)
+        # empty items still cost a little
+        totals[j] += max(sizes[i], 1)
+    return [np.sort(np.array(chunk, dtype=np.int64)) for chunk in chunks if chunk]
+
+
+def _init_worker(path, dictionary, phrases_model, params):
+    global _worker_state
+    _worker_state = dict(params, dictionary=dictionary, phrases_model=phrases_model)
+    for name in _ARRAYS:
+        _worker_state[name] = np.load(os.path.join(path, '{}.npy'.format(name)), mmap_mode='r')
+
+
+def _get_picklable(doc):
+    from src.corpus.documents import CorpusDocument, LazyCorpusDocument
+    if isinstance(doc, (str, CorpusDocument, LazyCorpusDocument)):
+        return doc
+    # database documents are sent as texts
+    return doc.text
+
+
+def _infer_chunk(chunk):
+    from src.preprocessing.documents import preprocess_documents
+    author_ids, author_texts, gamma = chunk
+    state = _worker_state
+    texts, doc_authors = [], []
+    for i, author_texts_i in enumerate(author_texts):
+        texts.extend(author_texts_i)
+        doc_authors.extend(i for _ in author_texts_i)
+    if texts:
+        dictionary = state['dictionary']
+        corpus, _, _, _, _ = preprocess_documents(
+            texts, return_type='sparse' if isinstance(dictionary, Dictionary) else 'tuple', dictionary=dictionary,
+            phrases_model=state['phrases_model'], author2doc={})
+        counts = next(iter_bow_batches(corpus, state['num_terms'], batch_size=len(texts)))
+        gamma = fold_in_authors(counts, doc_authors, gamma, state['expElogbeta'], state['alpha'], state['rho'],
+                                state['iterations'], state['gamma_threshold'])
+    return author_ids, gamma
+
+
+class ParallelInference(object):
+    """Infers the topics of new authors in a pool of processes sharing the model arrays."""
+
+    def __init__(self, model, num_workers=None, chunks_per_worker=4, path=None):
+        """Saves the model arrays for the workers.
+
+        :param model: fitted `AuthorTopicModel`.
+        :param num_workers: number of processes, see `parallel.get_num_workers`.
+        :param chunks_per_worker: number of chunks of authors per worker, more chunks balance the load better.
+        :param path: directory to save the arrays to, defaults to a new temporary directory removed on `close`.
+        """
+        self.model = model
+        self.num_workers = parallel.get_num_workers(num_workers)
+        self.chunks_per_worker = chunks_per_worker
+        self._remove_path = path is None
+        self.path = tempfile.mkdtemp(prefix='inference-') if path is None else path
+        os.makedirs(self.path, exist_ok=True)
+        base_model = model._base_model
+        np.save(os.path.join(self.path, 'expElogbeta.npy'), base_model.expElogbeta)
+        np.save(os.path.join(self.path, 'alpha.npy'), base_model.alpha)
+        self._params = {
+            'num_terms': base_model.num_terms,
+            'rho': pow(base_model.offset + 1 + 1, -base_model.decay),
+            'iterations': base_model.iterations,
+            'gamma_threshold': base_model.gamma_threshold,
+        }
+        phrases_model = model.phrases_model
+        if hasattr(phrases_model, 'freeze'):
+            # frozen phrases extract the same phrases and are smaller to send to workers
+            phrases_model = phrases_model.freeze()
+        self._phrases_model = phrases_model
+
+    def close(self):
+        """Removes the arrays if saved to a temporary directory.
+
+        :return: None.
+        """
+        if self._remove_path and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def infer_authors(self, authors, minimum_probability=None, verbose=False):
+        """Gets the topic distributions of new authors, see `AuthorTopicModel.infer_authors`.
+
+        :param authors: mapping of author names to lists of documents.
+        :param minimum_probability: topic probabilities below this value are set to zero, defaults to the minimum
+            probability of the model.
+        :param verbose: whether to show progress in terminal.
+        :return: topic probabilities of shape (num_authors, num_topics) in the order of `authors`.
+        """
+        import tqdm
+        base_model = self.model._base_model
+        author_texts = [[_get_picklable(doc) for doc in docs] for docs in authors.values()]
+        sizes = np.array([len(texts) for texts in author_texts], dtype=np.int64)
+        # same initial topics of new authors as `AuthorTopicModel.infer_authors`
+        gamma = base_model.random_state.gamma(100., 1. / 100., (len(sizes), self.model.num_topics))
+        chunks = (
+            (author_ids, [author_texts[i] for i in author_ids], gamma[author_ids])
+            for author_ids in get_balanced_chunks(sizes, self.num_workers * self.chunks_per_worker)
+        )
+        initargs = (self.path, self.model.dictionary, self._phrases_model, self._params)
+        results = parallel.imap(_infer_chunk, chunks, num_workers=self.num_workers, ordered=False,
+                                executor='process', initializer=_init_worker, initargs=initargs)
+        if verbose:
+            results = tqdm.tqdm(results, desc='Inferring Author Topic Probabilities', unit='chunks')
+        for author_ids, chunk_gamma in results:
+            gamma[author_ids] = chunk_gamma
+        topic_proba = gamma / gamma.sum(axis=1)[:, None]
+        if minimum_probability is None:
+            minimum_probability = base_model.minimum_probability
+        topic_proba[topic_proba < max(minimum_probability, 1e-8)] = 0.0
+        topic_proba[sizes == 0] = 0.0
+        return topic_proba
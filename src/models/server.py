@@ -0,0 +1,402 @@
+"""Local inference server that keeps topic models in memory and batches concurrent requests.
+
+The server listens on a Unix socket (or a localhost TCP port) and speaks newline-delimited JSON: each request
+  is one JSON object on a line and gets one JSON object back. Requests for the topics of new authors received
+  within `max_latency` seconds of each other are inferred together with `AuthorTopicModel.infer_authors`, up to
+  `max_batch_size` requests per batch.
+
+Methods:
+    {"method": "infer", "model": <name>, "docs": [<text>, ...]} -> {"result": [<topic probability>, ...]}
+        topics of the documents as a new author, as `AuthorTopicModel.get_new_author_topics`. The model name can
+        be omitted if the server has a single model.
+    {"method": "models"} -> {"result": {<name>: <num topics>, ...}}
+    {"method": "stats"} -> {"result": {...}} throughput and queue depth of each model, see `InferenceServer.stats`.
+Errors are returned as {"error": <message>}.
+
+Usage (from project root):
+    python -m src.models.server --model v0-T6-E1 --max-batch-size 64 --max-latency 0.01
+"""
+import argparse
+import asyncio
+import errno
+import json
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import config
+from src.models.author_topic_model import AuthorTopicModel
+from src.models.topic_model_utils import format_topic_model_name, list_topic_models
+
+__all__ = [
+    'InferenceServer',
+    'InferenceClient',
+    'get_socket_path',
+    'load_models',
+]
+
+logger = logging.getLogger(__name__)
+
+# maximum size of a request line
+_STREAM_LIMIT = 2 ** 26
+
+
+def get_socket_path():
+    """Gets the default path of the Unix socket of the inference server.
+
+    :return: path to the socket.
+    """
+    return os.path.join(config['DEFAULT']['project_path'], 'data', 'interim', 'inference.sock')
+
+
+def load_models(names=None, path=None):
+    """Loads saved topic models.
+
+    :param names: names of models (e.g., 'v0-T6-E1'), defaults to all models in `path`.
+    :param path: base path of models, defaults to the models folder of the project.
+    :return: dict of model names to `AuthorTopicModel`.
+    """
+    base_path = path
+    if base_path is None:
+        base_path = os.path.join(config['DEFAULT']['project_path'], 'models')
+    if names is None:
+        names = [format_topic_model_name(num_topics=m['num_topics'], epoch=m['epoch'], version=m['version'])
+                 for m in list_topic_models(base_path)]
+    return {name: AuthorTopicModel.load(os.path.join(base_path, name, 'model.pt')) for name in names}
+
+
+def _is_serving(path):
+    # whether a server accepts connections on the Unix socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except ConnectionRefusedError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class _ModelStats(object):
+    """Counters of the requests of a model."""
+
+    def __init__(self):
+        self.requests = 0
+        self.documents = 0
+        self.batches = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.latency_seconds = 0.0
+
+    def to_dict(self, uptime, queue_depth):
+        return {
+            'requests': self.requests,
+            'documents': self.documents,
+            'batches': self.batches,
+            'errors': self.errors,
+            'queue_depth': queue_depth,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'mean_latency': self.latency_seconds / self.requests if self.requests else 0.0,
+            'requests_per_second': self.requests / uptime if uptime > 0 else 0.0,
+            'documents_per_second': self.documents / self.busy_seconds if self.busy_seconds > 0 else 0.0,
+            'utilization': self.busy_seconds / uptime if uptime > 0 else 0.0,
+        }
+
+
+class InferenceServer(object):
+    """Serves topic inference of loaded models with micro-batching of concurrent requests."""
+
+    def __init__(self, models, max_batch_size=64, max_latency=0.01):
+        """Creates the server.
+
+        :param models: dict of model names to fitted `AuthorTopicModel`.
+        :param max_batch_size: maximum number of requests inferred together.
+        :param max_latency: maximum seconds a request waits for other requests to be batched with.
+        """
+        if not models:
+            raise ValueError('at least one model is required.')
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size should be a positive integer, found {}'.format(max_batch_size))
+        self.models = models
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self._queues = None
+        self._stats = {name: _ModelStats() for name in models}
+        self._tasks = []
+        self._server = None
+        self._start_time = None
+        # inference of a model is not thread safe (random state), batches run one at a time
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self, path=None, host=None, port=None):
+        """Starts listening on a Unix socket, or on a TCP port if `port` is provided.
+
+        A stale socket file is replaced, an `OSError` is raised if another server is listening on it.
+
+        :param path: path to the Unix socket, defaults to `get_socket_path()`.
+        :param host: host of the TCP server, defaults to localhost.
+        :param port: port of the TCP server.
+        :return: None.
+        """
+        if port is not None:
+            self._server = await asyncio.start_server(self._handle_connection, host or '127.0.0.1', port,
+                                                      limit=_STREAM_LIMIT)
+        else:
+            path = get_socket_path() if path is None else path
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if os.path.exists(path):
+                if _is_serving(path):
+                    raise OSError(errno.EADDRINUSE, 'another server is listening on {}'.format(path))
+                # socket left by a server that did not shut down
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(self._handle_connection, path, limit=_STREAM_LIMIT)
+        self._start_time = time.monotonic()
+        self._queues = {name: asyncio.Queue() for name in self.models}
+        self._tasks = [asyncio.ensure_future(self._run_batches(name)) for name in self.models]
+        logger.info('Serving models {} on {}.'.format(', '.join(self.models), self.address))
+
+    @property
+    def address(self):
+        """Address the server listens on, path of the Unix socket or (host, port)."""
+        return self._server.sockets[0].getsockname()
+
+    async def close(self):
+        """Stops the server and the batching of requests.
+
+        :return: None.
+        """
+        if self._server is not None:
+            address = self.address
+            self._server.close()
+            await self._server.wait_closed()
+            if isinstance(address, str) and os.path.exists(address):
+                os.remove(address)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def serve_forever(self, path=None, host=None, port=None):
+        """Starts the server (see `start`) and serves until cancelled.
+
+        :return: None.
+        """
+        await self.start(path=path, host=host, port=port)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def infer(self, docs, model=None):
+        """Gets the topic distribution of documents as a new author, batched with concurrent requests.
+
+        :param docs: list of documents (texts).
+        :param model: name of the model, can be None if the server has a single model.
+        :return: topic probabilities (list).
+        """
+        name = self._get_model_name(model)
+        if not (isinstance(docs, (list, tuple)) and all(isinstance(doc, str) for doc in docs)):
+            raise ValueError('docs should be a list of texts.')
+        future = asyncio.get_running_loop().create_future()
+        await self._queues[name].put((list(docs), future, time.monotonic()))
+        return await future
+
+    def stats(self):
+        """Gets the throughput and queue depth of each model.
+
+        :return: dict with the uptime in seconds and the stats of each model.
+        """
+        uptime = time.monotonic() - self._start_time if self._start_time is not None else 0.0
+        return {
+            'uptime': uptime,
+            'max_batch_size': self.max_batch_size,
+            'max_latency': self.max_latency,
+            'models': {
+                name: stats.to_dict(uptime, self._queues[name].qsize() if self._queues else 0)
+                for name, stats in self._stats.items()
+            },
+        }
+
+    def _get_model_name(self, model):
+        if model is None:
+            if len(self.models) > 1:
+                raise ValueError('model is required when serving more than one model.')
+            return next(iter(self.models))
+        if model not in self.models:
+            raise ValueError('unknown model: {}'.format(model))
+        return model
+
+    async def _get_batch(self, queue):
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_batches(self, name):
+        model, stats, queue = self.models[name], self._stats[name], self._queues[name]
+        while True:
+            batch = await self._get_batch(queue)
+            if not await self._run_batch(model, stats, batch, fail=len(batch) == 1):
+                logger.warning('Failed to infer a batch of {} requests, retrying one at a time.'.format(len(batch)))
+                # a failed request should not fail the requests batched with it
+                for item in batch:
+                    await self._run_batch(model, stats, [item])
+
+    async def _run_batch(self, model, stats, batch, fail=True):
+        # infers a batch, sets the error of its requests if it fails and `fail` is True
+        loop = asyncio.get_running_loop()
+        authors = {i: docs for i, (docs, _, _) in enumerate(batch)}
+        start = time.monotonic()
+        try:
+            topic_proba = await loop.run_in_executor(self._executor, model.infer_authors, authors)
+        except Exception as ex:
+            if not fail:
+                return False
+            logger.exception('Failed to infer a batch of {} requests.'.format(len(batch)))
+            stats.errors += len(batch)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(ex)
+            return True
+        self._set_results(stats, batch, topic_proba, start)
+        return True
+
+    @staticmethod
+    def _set_results(stats, batch, topic_proba, start):
+        end = time.monotonic()
+        stats.batches += 1
+        stats.requests += len(batch)
+        stats.documents += sum(len(docs) for docs, _, _ in batch)
+        stats.busy_seconds += end - start
+        for (_, future, received), row in zip(batch, topic_proba):
+            stats.latency_seconds += end - received
+            if not future.done():
+                future.set_result(row.tolist())
+
+    async def _handle_request(self, request):
+        method = request.get('method')
+        if method == 'infer':
+            return await self.infer(request.get('docs', []), model=request.get('model'))
+        elif method == 'models':
+            return {name: model.num_topics for name, model in self.models.items()}
+        elif method == 'stats':
+            return self.stats()
+        raise ValueError('unknown method: {}'.format(method))
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = {'result': await self._handle_request(json.loads(line))}
+                except Exception as ex:
+                    response = {'error': str(ex)}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class InferenceClient(object):
+    """Blocking client of the inference server."""
+
+    def __init__(self, path=None, host=None, port=None, timeout=None):
+        """Connects to the server on a Unix socket, or on a TCP port if `port` is provided.
+
+        :param path: path to the Unix socket, defaults to `get_socket_path()`.
+        :param host: host of the TCP server, defaults to localhost.
+        :param port: port of the TCP server.
+        :param timeout: timeout of requests in seconds.
+        """
+        if port is not None:
+            self._socket = socket.create_connection((host or '127.0.0.1', port), timeout=timeout)
+        else:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(get_socket_path() if path is None else path)
+        self._file = self._socket.makefile('rwb')
+
+    def close(self):
+        """Closes the connection.
+
+        :return: None.
+        """
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _request(self, **request):
+        self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('connection closed by the inference server.')
+        response = json.loads(line)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['result']
+
+    def infer(self, docs, model=None):
+        """Gets the topic distribution of documents as a new author.
+
+        :param docs: list of documents (texts).
+        :param model: name of the model, can be None if the server has a single model.
+        :return: topic probabilities (list).
+        """
+        return self._request(method='infer', docs=list(docs), model=model)
+
+    def models(self):
+        """Gets the models of the server.
+
+        :return: dict of model names to number of topics.
+        """
+        return self._request(method='models')
+
+    def stats(self):
+        """Gets the throughput and queue depth of each model, see `InferenceServer.stats`.
+
+        :return: dict of stats.
+        """
+        return self._request(method='stats')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', action='append', dest='models',
+                        help='name of a model to serve, all saved models by default.')
+    parser.add_argument('--models-path', default=None)
+    parser.add_argument('--socket', default=None, help='path to the Unix socket.')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None, help='serve on a localhost TCP port instead of a socket.')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency', type=float, default=0.01)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = InferenceServer(load_models(args.models, path=args.models_path), max_batch_size=args.max_batch_size,
+                             max_latency=args.max_latency)
+    try:
+        asyncio.run(server.serve_forever(path=args.socket, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""Compact corpus of token ids for topic modeling.
+
+A `RaggedCorpus` stores the tokens of all documents as a single int32 array of token ids with an offsets
+  array (as the indptr of a CSR matrix), and a vocabulary shared by all documents. Token ids are assigned
+  in the same order as `gensim.corpora.Dictionary`, so the corpus converts to and from the
+  `(corpus, author2doc, tokenized_docs, dictionary, phrases_model)` tuple of `preprocess_documents`.
+
+Tokens that are not in the dictionary (when a dictionary is provided) get ids after the ids of the
+  dictionary, they are part of `tokenized_docs` but not of the bag of words.
+"""
+import array
+import copy
+from collections import defaultdict
+
+import numpy as np
+import scipy.sparse
+import tqdm
+from gensim.corpora import Dictionary
+from gensim.matutils import Sparse2Corpus
+
+from src.preprocessing.documents import _get_corpus_documents, _get_phrases_model
+from src.preprocessing.phrases import apply_phrases
+from src.preprocessing.vocabulary import prune_dictionary
+
+__all__ = [
+    'RaggedCorpus',
+]
+
+
+class _RaggedView(object):
+    """Read-only sequence over documents of a `RaggedCorpus`."""
+
+    def __init__(self, corpus, get_item):
+        self._corpus = corpus
+        self._get_item = get_item
+
+    def __len__(self):
+        return len(self._corpus)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._get_item(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('document index out of range')
+        return self._get_item(idx)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get_item(i)
+
+
+class RaggedCorpus(object):
+    """Tokens of documents as a ragged array of token ids with a shared vocabulary."""
+
+    def __init__(self, token_ids, offsets, vocab, num_terms=None, author2doc=None, phrases_model=None,
+                 dictionary=None):
+        """Creates a corpus from its arrays, see `from_documents` and `from_tuple` to build one.
+
+        :param token_ids: token ids of all documents, concatenated (int32 array).
+        :param offsets: start of each document in `token_ids` followed by the total number of tokens.
+        :param vocab: list of tokens indexed by token id.
+        :param num_terms: number of tokens of `vocab` in the dictionary, defaults to the size of `vocab`.
+        :param author2doc: mapping of authors to document indices.
+        :param phrases_model: phrases model used to extract phrase tokens.
+        :param dictionary: `Dictionary` of the first `num_terms` tokens, created from the corpus if None.
+        """
+        self.token_ids = np.asarray(token_ids, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.vocab = vocab
+        self.num_terms = len(vocab) if num_terms is None else num_terms
+        self._author2doc = author2doc
+        self._author2doc_slice = None
+        self.phrases_model = phrases_model
+        self._dictionary = dictionary
+        self._bow = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        """Gets token ids of a document or a corpus of a range of documents.
+
+        :param idx: document index or slice with step 1.
+        :return: token ids (view of `token_ids`) or `RaggedCorpus` sharing the arrays and vocabulary.
+        """
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                raise ValueError('slicing with steps is not supported.')
+            stop = max(start, stop)
+            offsets = self.offsets[start:stop + 1]
+            corpus = RaggedCorpus(self.token_ids[offsets[0]:offsets[-1]], offsets - offsets[0], self.vocab,
+                                  num_terms=self.num_terms, phrases_model=self.phrases_model,
+                                  dictionary=self._dictionary)
+            # author2doc of the slice is created from this corpus on first access
+            corpus._author2doc_slice = (self, start, stop)
+            return corpus
+        return self.token_ids[self.offsets[idx]:self.offsets[idx + 1]]
+
+    @property
+    def author2doc(self):
+        """Gets the mapping of authors to document indices.
+
+        :return: dict of author to list of document indices or None if not available.
+        """
+        if self._author2doc_slice is not None:
+            parent, start, stop = self._author2doc_slice
+            self._author2doc_slice = None
+            if parent.author2doc is not None:
+                author2doc = {
+                    author: [i - start for i in doc_ids if start <= i < stop]
+                    for author, doc_ids in parent.author2doc.items()
+                }
+                self._author2doc = {author: doc_ids for author, doc_ids in author2doc.items() if doc_ids}
+        return self._author2doc
+
+    @property
+    def nbytes(self):
+        """Gets the number of bytes of the token arrays.
+
+        :return: number of bytes.
+        """
+        nbytes = self.token_ids.nbytes + self.offsets.nbytes
+        if self._bow is not None:
+            nbytes += sum(x.nbytes for x in self._bow)
+        return nbytes
+
+    @property
+    def lengths(self):
+        """Gets the number of tokens of each document.
+
+        :return: array of document lengths.
+        """
+        return np.diff(self.offsets)
+
+    @property
+    def dictionary(self):
+        """Gets the dictionary of the corpus.
+
+        :return: `Dictionary` object.
+        """
+        if self._dictionary is None:
+            self._dictionary = self._create_dictionary()
+        return self._dictionary
+
+    def _create_dictionary(self):
+        dictionary = Dictionary()
+        dictionary.token2id = {token: i for i, token in enumerate(self.vocab[:self.num_terms])}
+        indptr, indices, counts = self._get_bow()
+        dictionary.cfs = dict(enumerate(np.bincount(indices, weights=counts, minlength=self.num_terms)
+                                        .astype(np.int64).tolist()))
+        dictionary.dfs = dict(enumerate(np.bincount(indices, minlength=self.num_terms).tolist()))
+        dictionary.num_docs = len(self)
+        dictionary.num_pos = int(np.count_nonzero(self.token_ids < self.num_terms))
+        dictionary.num_nnz = len(indices)
+        return dictionary
+
+    def _get_bow(self):
+        if self._bow is None:
+            doc_ids = np.repeat(np.arange(len(self), dtype=np.int64), self.lengths)
+            mask = self.token_ids < self.num_terms
+            keys = doc_ids[mask] * max(self.num_terms, 1) + self.token_ids[mask]
+            keys, counts = np.unique(keys, return_counts=True)
+            indices = (keys % max(self.num_terms, 1)).astype(np.int32)
+            indptr = np.searchsorted(keys // max(self.num_terms, 1), np.arange(len(self) + 1)).astype(np.int64)
+            self._bow = (indptr, indices, counts.astype(np.int32))
+        return self._bow
+
+    def get_tokens(self, idx):
+        """Gets tokens of a document.
+
+        :param idx: document index.
+        :return: list of tokens.
+        """
+        vocab = self.vocab
+        return [vocab[i] for i in self[idx].tolist()]
+
+    def get_bow(self, idx):
+        """Gets bag of words of a document.
+
+        :param idx: document index.
+        :return: list of (token id, count) in ascending token id order, see `Dictionary.doc2bow`.
+        """
+        indptr, indices, counts = self._get_bow()
+        start, end = indptr[idx], indptr[idx + 1]
+        return list(zip(indices[start:end].tolist(), counts[start:end].tolist()))
+
+    def filter_extremes(self, min_df=0, max_df=1.0, keep_n=None, keywords=None):
+        """Prunes the vocabulary of the corpus, see `src.preprocessing.vocabulary.prune_dictionary`.
+
+        Tokens removed from the dictionary keep their place in the documents with ids after the dictionary ids,
+          as tokens that are not in a provided dictionary.
+
+        :param min_df: minimum document frequency of tokens.
+        :param max_df: maximum document frequency of tokens (as a fraction of number of documents).
+        :param keep_n: number of most frequent tokens to keep, all tokens if None.
+        :param keywords: mapping of topics to seed keywords that are never pruned.
+        :return: `RaggedCorpus` with the pruned dictionary.
+        """
+        dictionary = copy.deepcopy(self.dictionary)
+        prune_dictionary(dictionary, min_df=min_df, max_df=max_df, keep_n=keep_n, keywords=keywords)
+        _ = dictionary[0] if len(dictionary) > 0 else None  # initialize dictionary.id2token
+        vocab = [dictionary.id2token[i] for i in range(len(dictionary))]
+        vocab.extend(token for token in self.vocab if token not in dictionary.token2id)
+        token2id = {token: i for i, token in enumerate(vocab)}
+        mapping = np.array([token2id[token] for token in self.vocab], dtype=np.int32)
+        return RaggedCorpus(mapping[self.token_ids], self.offsets, vocab, num_terms=len(dictionary),
+                            author2doc=self.author2doc, phrases_model=self.phrases_model, dictionary=dictionary)
+
+    def to_csc(self, dtype=np.float64):
+        """Gets the term-document matrix of the corpus.
+
+        :param dtype: data type of the matrix.
+        :return: `scipy.sparse.csc_matrix` of shape (num_terms, num_docs), see `gensim.matutils.corpus2csc`.
+        """
+        indptr, indices, counts = self._get_bow()
+        return scipy.sparse.csc_matrix((counts.astype(dtype), indices, indptr), shape=(self.num_terms, len(self)))
+
+    def to_csr(self, dtype=np.float64):
+        """Gets the document-term matrix of the corpus.
+
+        :param dtype: data type of the matrix.
+        :return: `scipy.sparse.csr_matrix` of shape (num_docs, num_terms).
+        """
+        indptr, indices, counts = self._get_bow()
+        return scipy.sparse.csr_matrix((counts.astype(dtype), indices, indptr), shape=(len(self), self.num_terms))
+
+    def to_tuple(self, sparse=False):
+        """Converts the corpus to the output of `preprocess_documents`.
+
+        Corpus and tokenized documents are read-only sequences created from the arrays on access.
+
+        :param sparse: whether the corpus is a `gensim.matutils.Sparse2Corpus` view of the term-document matrix
+            (see `to_csc`) instead of a sequence of bag of words. The matrix is available as `corpus.sparse`.
+        :return: tuple of (corpus, author2doc, tokenized_docs, dictionary, phrases_model).
+        """
+        if sparse:
+            corpus = Sparse2Corpus(self.to_csc(), documents_columns=True)
+        else:
+            corpus = _RaggedView(self, self.get_bow)
+        tokenized_docs = _RaggedView(self, self.get_tokens)
+        return corpus, self.author2doc, tokenized_docs, self.dictionary, self.phrases_model
+
+    @classmethod
+    def from_tokenized(cls, tokenized_docs, dictionary=None, author2doc=None, phrases_model=None, verbose=False):
+        """Creates a corpus from tokenized documents in a single pass.
+
+        :param tokenized_docs: iterable of lists of tokens.
+        :param dictionary: dictionary to assign token ids from. Created from the documents if None.
+        :param author2doc: mapping of authors to document indices.
+        :param phrases_model: phrases model used to extract phrase tokens.
+        :param verbose: whether to show progress in terminal.
+        :return: `RaggedCorpus`.
+        """
+        if dictionary is not None:
+            _ = dictionary[0]  # initialize dictionary.id2token
+            token2id = dict(dictionary.token2id)
+            vocab = [dictionary.id2token[i] for i in range(len(dictionary))]
+        else:
+            token2id, vocab = {}, []
+        token_ids, offsets = array.array('i'), array.array('q', [0])
+        if verbose:
+            tokenized_docs = tqdm.tqdm(tokenized_docs, desc='Extracting Token Ids')
+        for tokens in tokenized_docs:
+            # new tokens get ids in sorted order per document as in `Dictionary.doc2bow`
+            missing = sorted(set(token for token in tokens if token not in token2id))
+            for token in missing:
+                token2id[token] = len(vocab)
+                vocab.append(token)
+            token_ids.extend([token2id[token] for token in tokens])
+            offsets.append(len(token_ids))
+        num_terms = len(vocab) if dictionary is None else len(dictionary)
+        return cls(np.frombuffer(token_ids, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64), vocab,
+                   num_terms=num_terms, author2doc=author2doc, phrases_model=phrases_model, dictionary=dictionary)
+
+    @classmethod
+    def from_documents(cls, docs, phrases_model=None, dictionary=None, author2doc=None, verbose=False,
+                       token_cache=None, num_workers=0, phrases_cache=None):
+        """Creates a corpus from documents, see `preprocess_documents`.
+
+        :param docs: the documents to process.
+        :param phrases_model: a prebuilt phrase model or path to one. Trained on the documents if None.
+        :param dictionary: dictionary to assign token ids from. Created from the documents if None.
+        :param author2doc: mapping of authors to document indices. Created from the documents if None.
+        :param verbose: whether to show progress in terminal.
+        :param token_cache: `TokenCache`, path to the cache database or True for the default cache.
+        :param num_workers: number of processes to learn and extract phrases with, see `preprocess_documents`.
+        :param phrases_cache: directory of persisted phrase models or True, see `preprocess_documents`.
+        :return: `RaggedCorpus`.
+        """
+        docs = _get_corpus_documents(docs, token_cache=token_cache)
+        phrases_model = _get_phrases_model(phrases_model, [doc.tokens for doc in docs], num_workers=num_workers,
+                                           phrases_cache=phrases_cache)
+
+        def _iter_tokens():
+            phrases = apply_phrases(phrases_model, (doc.tokens for doc in docs), num_workers=num_workers)
+            for doc, doc_phrases in zip(docs, phrases):
+                yield list(doc.tokens) + doc_phrases
+
+        if author2doc is None:
+            author2doc = defaultdict(list)
+            for i, doc in enumerate(docs):
+                author2doc[doc.author_id].append(i)
+            author2doc = dict(author2doc)
+        return cls.from_tokenized(_iter_tokens(), dictionary=dictionary, author2doc=author2doc,
+                                  phrases_model=phrases_model, verbose=verbose)
+
+    @classmethod
+    def from_tuple(cls, data):
+        """Creates a corpus from the output of `preprocess_documents`.
+
+        Documents are created from `tokenized_docs`, or from the bag of words (in token id order) if not available.
+
+        :param data: tuple of (corpus, author2doc, tokenized_docs, dictionary, phrases_model).
+        :return: `RaggedCorpus`.
+        """
+        corpus, author2doc, tokenized_docs, dictionary, phrases_model = data
+        if tokenized_docs is None:
+            _ = dictionary[0]  # initialize dictionary.id2token
+            tokenized_docs = ([dictionary.id2token[i] for i, count in bow for _ in range(int(count))] for bow in corpus)
+        return cls.from_tokenized(tokenized_docs, dictionary=dictionary, author2doc=author2doc,
+                                  phrases_model=phrases_model)
@@ -1,15 +1,16 @@
 """Process documents."""
-import random
+import logging
 from collections import defaultdict
 
 import numpy as np
 import six
 import tqdm
-from gensim.corpora import Dictionary
+from gensim.corpora import Dictionary, HashDictionary
 from gensim.models import Phrases
-from gensim.models.phrases import ENGLISH_CONNECTOR_WORDS
-# noinspection PyPackageRequirements
-from imblearn.under_sampling import RandomUnderSampler
+
+from src.preprocessing.phrases import apply_phrases, load_or_train_phrases, train_phrases
+from src.preprocessing.sampling import random_undersample
+from src.preprocessing.vocabulary import is_pruned, prune_dictionary
 
 __all__ = [
     'filter_documents',
@@ -17,117 +18,207 @@ __all__ = [
     'preprocess_documents',
 ]
 
+logger = logging.getLogger(__name__)
+
 
-def filter_documents_for_topic_modeling(docs, verbose=False):
+def filter_documents_for_topic_modeling(docs, verbose=False, near_duplicates=False, threshold=0.8, num_perm=128,
+                                        sampling_strategy='majority', random_state=42):
     """Filter documents for training topic models.
 
     :param docs: documents to filter.
     :param verbose: whether to show progress in terminal.
-    :return: filtered documents.
+    :param near_duplicates: whether to also remove near duplicates, documents whose token sets have an
+        estimated Jaccard similarity of at least `threshold` with an earlier document (see
+        `src.preprocessing.duplicates.find_near_duplicates`). Only exact duplicates are removed otherwise.
+    :param threshold: Jaccard similarity threshold of near duplicates.
+    :param num_perm: number of MinHash permutations used to estimate the similarity of near duplicates.
+    :param sampling_strategy: strategy to undersample documents by keyword topic, see
+        `src.preprocessing.sampling.random_undersample`. Documents are labeled with one of their keyword topics
+        at random or 'other'.
+    :param random_state: seed of the labels and the undersampling.
+    :return: filtered documents. The number of duplicates removed is logged.
     """
     filtered = []
     for doc in docs:
         if len(doc.tokens) > 5:
             filtered.append(doc)
     docs = filtered
-    unique_docs = []
-    observed_set = set()
-    docs_iter = docs
-    if verbose:
-        docs_iter = tqdm.tqdm(docs, desc='Extracting Unique Documents')
-    for doc in docs_iter:
-        doc_tokens = tuple(sorted(doc.tokens))
-        if doc_tokens not in observed_set:
-            unique_docs.append(doc)
-            observed_set.add(doc_tokens)
+    if near_duplicates:
+        from src.preprocessing.duplicates import find_near_duplicates
+        duplicates = find_near_duplicates((doc.tokens for doc in docs), threshold=threshold, num_perm=num_perm,
+                                          verbose=verbose)
+        unique_docs = [doc for doc, is_duplicate in zip(docs, duplicates.tolist()) if not is_duplicate]
+    else:
+        unique_docs = []
+        observed_set = set()
+        docs_iter = docs
+        if verbose:
+            docs_iter = tqdm.tqdm(docs, desc='Extracting Unique Documents')
+        for doc in docs_iter:
+            doc_tokens = tuple(sorted(doc.tokens))
+            if doc_tokens not in observed_set:
+                unique_docs.append(doc)
+                observed_set.add(doc_tokens)
+    msg = '{} {}duplicates removed from a total of {} documents.'.format(
+        len(docs) - len(unique_docs), 'near ' if near_duplicates else '', len(docs))
+    logger.info(msg)
     if verbose:
-        print('{} duplicates removed from a total of {} documents.'.format(len(docs) - len(unique_docs), len(docs)))
+        print(msg)
     labels = set()
     for i, doc in enumerate(unique_docs):
         labels.update(doc.keywords)
-    labels = list(labels) + ['other']
+    labels = sorted(labels) + ['other']
     label2id = dict(zip(labels, range(len(labels))))
-    rus = RandomUnderSampler(sampling_strategy='majority', random_state=42)
-    X, y = [], []
+    rng = np.random.default_rng(random_state)
+    y = np.full(len(unique_docs), label2id['other'], dtype=np.int32)
     for i, doc in enumerate(unique_docs):
-        X.append([i])
-        y_doc = [0 for _ in range(len(label2id))]
-        label = 'other'
         if len(doc.keywords) > 0:
-            label = random.choice(doc.keywords)
-        y_doc[label2id[label]] = 1
-        y.append(y_doc)
-    X = np.array(X)
-    y = np.array(y)
-    X_res, y_res = rus.fit_resample(X, y)
-    docs_sample = [unique_docs[x[0]] for x in tqdm.tqdm(X_res, desc='Selecting Documents')]
+            y[i] = label2id[doc.keywords[rng.integers(len(doc.keywords))]]
+    idx = random_undersample(y, sampling_strategy=sampling_strategy, random_state=rng)
+    docs_sample = [unique_docs[i] for i in tqdm.tqdm(idx.tolist(), desc='Selecting Documents')]
     return docs_sample
 
 
-def _get_corpus_documents(docs):
+def _get_corpus_documents(docs, token_cache=None):
     from src.dashboard.models import Document
-    from src.corpus.documents import CorpusDocument
-    result = []
-    for doc in docs:
+    from src.corpus.documents import CorpusDocument, LazyCorpusDocument
+    from src.corpus.token_cache import id_key, text_key
+    result = [None for _ in docs]
+    pending = []
+    for i, doc in enumerate(docs):
         if isinstance(doc, Document):
-            cd = CorpusDocument(doc.text, author=doc.author_id)
-            result.append(cd)
+            pending.append((i, doc.text, doc.author_id, text_key(doc.text) if doc.id is None else id_key(doc.id)))
         elif isinstance(doc, six.string_types):
-            cd = CorpusDocument(doc, author='<Unknown>')
-            result.append(cd)
-        elif isinstance(doc, CorpusDocument):
-            result.append(doc)
+            pending.append((i, doc, '<Unknown>', text_key(doc)))
+        elif isinstance(doc, (CorpusDocument, LazyCorpusDocument)):
+            result[i] = doc
         else:
             raise ValueError('invalid corpus document format.')
+    if pending:
+        idx, texts, authors, keys = zip(*pending)
+        cds = CorpusDocument.create_many(list(texts), authors=list(authors), keys=list(keys), token_cache=token_cache)
+        for i, cd in zip(idx, cds):
+            result[i] = cd
     assert len(result) == len(docs), 'documents went missing during processing.'
     return result
 
 
+def _load_phrases_model(phrases_model):
+    if isinstance(phrases_model, str):
+        try:
+            phrases_model = Phrases.load(phrases_model)
+        except FileNotFoundError as ex:
+            phrases_model = None
+    return phrases_model
+
+
+def _get_phrases_model(phrases_model, tokenized_docs, num_workers=0, phrases_cache=None, verbose=False):
+    phrases_model = _load_phrases_model(phrases_model)
+    if phrases_model is None:
+        if phrases_cache is None:
+            phrases_model = train_phrases(tokenized_docs, num_workers=num_workers, verbose=verbose)
+        else:
+            phrases_model = load_or_train_phrases(tokenized_docs, cache_path=None if phrases_cache is True else
+                                                  phrases_cache, num_workers=num_workers, verbose=verbose)
+    return phrases_model
+
+
 def preprocess_documents(docs, return_type='tuple', phrases_model=None, dictionary=None,
-                         author2doc=None, verbose=False):
+                         author2doc=None, verbose=False, token_cache=None, streaming=False, output_path=None,
+                         chunk_size=10000, num_workers=0, phrases_cache=None, min_df=0, max_df=1.0, keep_n=None,
+                         keywords=None, hash_buckets=None):
     """Preprocess documents and returns a dict containing dictionary, corpus, and author2doc.
 
     :param docs: the documents to process.
     :param phrases_model: a prebuilt phrase model available.
     :param dictionary: dictionary.
     :param author2doc: dictionary.
-    :param return_type: return type as string.
+    :param return_type: return type as string {'tuple', 'dict', 'ragged', 'sparse'}. 'ragged' returns a
+        `RaggedCorpus`. 'sparse' returns a tuple where the corpus is a `Sparse2Corpus` view of a term-document
+        matrix built from the token arrays of a `RaggedCorpus`, see `RaggedCorpus.to_tuple`.
     :param verbose: whether to show progress in terminal.
+    :param token_cache: `TokenCache`, path to the cache database or True for the default cache,
+        used to get the tokens of documents that are not `CorpusDocument`.
+    :param streaming: whether to process documents out-of-core, see `preprocess_documents_streaming`.
+        Documents can then be any iterable, the corpus is written to `output_path`.
+    :param output_path: directory to write the corpus to when streaming, defaults to a new temporary directory.
+    :param chunk_size: number of documents tokenized at once when streaming.
+    :param num_workers: number of processes to learn and extract phrases with, 0 uses the calling process.
+        None uses all CPUs, see `src.preprocessing.phrases.train_phrases`.
+    :param phrases_cache: directory of phrase models persisted by the fingerprint of the documents or True for
+        the default directory. If provided, the phrase model is only trained once for the same documents.
+    :param min_df: minimum document frequency of token.
+    :param max_df: maximum document frequency of token (as a fraction of number of documents).
+    :param keep_n: number of words to keep in dictionary.
+        Tokens are only pruned when the dictionary is created from the documents, see `prune_dictionary`.
+    :param keywords: mapping of topics to seed keywords that are never pruned, defaults to the keywords used by
+        `CorpusDocument`.
+    :param hash_buckets: if provided, tokens are hashed to this number of ids with a `HashDictionary` instead of
+        creating a dictionary of all tokens, which bounds the vocabulary size of very large corpora.
+        Cannot be combined with pruning.
     :return:
     """
-    # TODO: add params min_df=0, max_df=1.0, keep_n=None,
-    # :param min_df: minimum document frequency of token.
-    # :param max_df: maximum document frequency of token (as a fraction of number of documents).
-    # :param keep_n: number of words to keep in dictionary.
-    docs = _get_corpus_documents(docs)
+    if (hash_buckets is not None) and is_pruned(min_df, max_df, keep_n):
+        raise ValueError('vocabulary pruning is not supported with hash buckets.')
+    if keywords is None:
+        from src.corpus import documents as corpus_documents
+        keywords = corpus_documents.keywords
+    if streaming:
+        from src.preprocessing.streaming import preprocess_documents_streaming
+        corpus, author2doc, tokenized_docs, dictionary, phrases_model = preprocess_documents_streaming(
+            docs, output_path=output_path, phrases_model=phrases_model, dictionary=dictionary,
+            author2doc=author2doc, chunk_size=chunk_size, verbose=verbose, token_cache=token_cache,
+            min_df=min_df, max_df=max_df, keep_n=keep_n, keywords=keywords, hash_buckets=hash_buckets,
+        )
+        if return_type == 'dict':
+            return {
+                'corpus': corpus,
+                'author2doc': author2doc,
+                'tokenized_docs': tokenized_docs,
+                'dictionary': dictionary,
+                'phrases_model': phrases_model,
+            }
+        return corpus, author2doc, tokenized_docs, dictionary, phrases_model
+    if return_type in ['ragged', 'sparse']:
+        from src.preprocessing.corpus import RaggedCorpus
+        if hash_buckets is not None:
+            raise ValueError('hash buckets are not supported by `RaggedCorpus`.')
+        corpus = RaggedCorpus.from_documents(docs, phrases_model=phrases_model, dictionary=dictionary,
+                                             author2doc=author2doc, verbose=verbose, token_cache=token_cache,
+                                             num_workers=num_workers, phrases_cache=phrases_cache)
+        if (dictionary is None) and is_pruned(min_df, max_df, keep_n):
+            num_terms = corpus.num_terms
+            corpus = corpus.filter_extremes(min_df=min_df, max_df=max_df, keep_n=keep_n, keywords=keywords)
+            if verbose:
+                print('{} tokens pruned from a vocabulary of {} tokens.'.format(num_terms - corpus.num_terms,
+                                                                               num_terms))
+        if return_type == 'sparse':
+            return corpus.to_tuple(sparse=True)
+        return corpus
+    docs = _get_corpus_documents(docs, token_cache=token_cache)
     tokenized_docs = []
     docs_iter = docs
     if verbose:
         docs_iter = tqdm.tqdm(docs, desc='Extracting Tokens')
     for i, doc in enumerate(docs_iter):
-        tokenized_docs.append(doc.tokens)
+        # copy as phrases are appended to the tokens below
+        tokenized_docs.append(list(doc.tokens))
     # Add phrases to docs (only ones that appear 20 times or more).
-    if isinstance(phrases_model, str):
-        try:
-            phrases_model = Phrases.load(phrases_model)
-        except FileNotFoundError as ex:
-            phrases_model = None
-    if phrases_model is None:
-        phrases_model = Phrases(tokenized_docs, min_count=10, threshold=1, connector_words=ENGLISH_CONNECTOR_WORDS)
-        phrases_model.freeze()
-    tokenized_docs_iter = range(len(tokenized_docs))
-    if verbose:
-        tokenized_docs_iter = tqdm.tqdm(tokenized_docs_iter, desc='Extracting Phrases')
-    for idx in tokenized_docs_iter:
-        for token in phrases_model[tokenized_docs[idx]]:
-            if '_' in token:
-                tokenized_docs[idx].append(token)
+    phrases_model = _get_phrases_model(phrases_model, tokenized_docs, num_workers=num_workers,
+                                       phrases_cache=phrases_cache, verbose=verbose)
+    phrases = apply_phrases(phrases_model, tokenized_docs, num_workers=num_workers, verbose=verbose)
+    for tokens, doc_phrases in zip(tokenized_docs, phrases):
+        tokens.extend(doc_phrases)
     # dictionary
-    if dictionary is None:
+    if (dictionary is None) and (hash_buckets is not None):
+        dictionary = HashDictionary(tokenized_docs, id_range=hash_buckets, debug=False)
+    elif dictionary is None:
         dictionary = Dictionary(tokenized_docs)
+        num_terms = len(dictionary)
+        num_pruned = prune_dictionary(dictionary, min_df=min_df, max_df=max_df, keep_n=keep_n, keywords=keywords)
+        if verbose and num_pruned > 0:
+            print('{} tokens pruned from a vocabulary of {} tokens.'.format(num_pruned, num_terms))
     _ = dictionary[0]  # initialize dictionary.id2token
-    # keep_tokens = [y.lower() for x in keywords.values() for y in x]
-    # dictionary.filter_extremes(no_below=min_df, no_above=max_df, keep_n=keep_n, keep_tokens=keep_tokens)
     # corpus
     corpus = []
     tokenized_docs_iter = tokenized_docs
@@ -0,0 +1,152 @@
+"""Near-duplicate detection of documents with MinHash and locality sensitive hashing (LSH).
+
+Each document is represented by the set of its tokens. MinHash signatures estimate the Jaccard similarity
+  of token sets: the fraction of equal signature values of two documents is an unbiased estimate of it.
+  Signatures are split into bands and documents sharing any band are candidate duplicates, which are then
+  verified against the threshold with their signatures. Candidates are found by sorting band values, so the
+  cost grows with n log(n) instead of the n^2 of comparing all pairs.
+"""
+import zlib
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import tqdm
+
+__all__ = [
+    'get_minhash_signatures',
+    'get_lsh_params',
+    'find_near_duplicates',
+]
+
+# prime larger than the 32 bit token hashes, signature values are below it and fit in uint32
+_PRIME = np.uint64((1 << 32) - 5)
+
+# permutation coefficients are below 2^31 so that a * hash + b does not overflow uint64
+_MAX_COEFFICIENT = 1 << 31
+
+
+def _get_token_hashes(tokenized_docs, chunk_size):
+    """Gets the hashes of unique tokens of documents in chunks.
+
+    :return: generator of (hashes, offsets) of each chunk of documents.
+    """
+    token_hashes = {}
+    hashes, offsets = [], [0]
+    for tokens in tokenized_docs:
+        for token in set(tokens):
+            h = token_hashes.get(token)
+            if h is None:
+                h = token_hashes[token] = zlib.crc32(token.encode('utf-8'))
+            hashes.append(h)
+        offsets.append(len(hashes))
+        if len(offsets) > chunk_size:
+            yield np.array(hashes, dtype=np.uint64), np.array(offsets, dtype=np.int64)
+            hashes, offsets = [], [0]
+    if len(offsets) > 1:
+        yield np.array(hashes, dtype=np.uint64), np.array(offsets, dtype=np.int64)
+
+
+def get_minhash_signatures(tokenized_docs, num_perm=128, seed=42, chunk_size=2000, verbose=False):
+    """Gets MinHash signatures of the token sets of documents.
+
+    :param tokenized_docs: iterable of lists of tokens.
+    :param num_perm: number of hash permutations (signature length).
+    :param seed: seed of the hash permutations. Signatures are only comparable with the same seed.
+    :param chunk_size: number of documents hashed at once, memory use grows with it.
+    :param verbose: whether to show progress in terminal.
+    :return: uint32 array of shape (num_docs, num_perm). Documents without tokens have all values set to the
+        maximum value.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MAX_COEFFICIENT, size=num_perm, dtype=np.uint64)[:, None]
+    b = rng.integers(0, _MAX_COEFFICIENT, size=num_perm, dtype=np.uint64)[:, None]
+    chunks = _get_token_hashes(tokenized_docs, chunk_size)
+    if verbose:
+        chunks = tqdm.tqdm(chunks, desc='Extracting MinHash Signatures', unit='chunks')
+    signatures = []
+    for hashes, offsets in chunks:
+        signature = np.full((len(offsets) - 1, num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+        non_empty = np.flatnonzero(np.diff(offsets) > 0)
+        if len(non_empty) > 0:
+            values = (a * (hashes % _PRIME)[None, :] + b) % _PRIME
+            signature[non_empty] = np.minimum.reduceat(values, offsets[non_empty], axis=1).T
+        signatures.append(signature)
+    if not signatures:
+        return np.empty((0, num_perm), dtype=np.uint32)
+    return np.concatenate(signatures)
+
+
+def get_lsh_params(threshold, num_perm=128, false_positive_weight=0.1):
+    """Gets the number of bands and rows per band that best separate documents at the Jaccard threshold.
+
+    Documents with Jaccard similarity s share at least one band with probability 1 - (1 - s^rows)^bands.
+      Parameters minimize the weighted area of false positives (below threshold) and false negatives (above).
+
+    :param threshold: Jaccard similarity threshold.
+    :param num_perm: number of hash permutations.
+    :param false_positive_weight: weight of false positives, false negatives have weight 1 - this. Low by
+        default as candidates are verified with their signatures, false positives only cost the verification.
+    :return: tuple of (bands, rows).
+    """
+    best, best_error = None, None
+    below = np.linspace(0, threshold, 101)
+    above = np.linspace(threshold, 1, 101)
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positives = (1 - (1 - below ** rows) ** bands).mean() * threshold
+            false_negatives = ((1 - above ** rows) ** bands).mean() * (1 - threshold)
+            error = false_positive_weight * false_positives + (1 - false_positive_weight) * false_negatives
+            if best_error is None or error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+def find_near_duplicates(tokenized_docs, threshold=0.8, num_perm=128, seed=42, verbose=False):
+    """Finds documents whose token sets are near duplicates of earlier documents.
+
+    Documents sharing a band of their signatures are candidate pairs, each document is verified against the
+      first and the previous document of each of its buckets. Documents are grouped by their verified candidate
+      pairs (transitively), the first document of each group is kept and the others are duplicates.
+
+    :param tokenized_docs: iterable of lists of tokens.
+    :param threshold: minimum estimated Jaccard similarity of token sets of near duplicates.
+    :param num_perm: number of hash permutations, higher values estimate the similarity more accurately.
+    :param seed: seed of the hash permutations.
+    :param verbose: whether to show progress in terminal.
+    :return: boolean array, True for documents that are duplicates of an earlier document.
+    """
+    signatures = get_minhash_signatures(tokenized_docs, num_perm=num_perm, seed=seed, verbose=verbose)
+    num_docs = len(signatures)
+    bands, rows = get_lsh_params(threshold, num_perm)
+    doc_ids = np.arange(num_docs, dtype=np.int64)
+    pairs = []
+    band_iter = range(bands)
+    if verbose:
+        band_iter = tqdm.tqdm(band_iter, desc='Finding Near Duplicates', unit='bands')
+    for band in band_iter:
+        keys = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel()
+        # documents sharing a band are compared with the first and the previous document of the bucket, so
+        #   that pairs of later members of a bucket are also verified with O(n) pairs per band
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        leaders = first[inverse]
+        candidates = leaders != doc_ids
+        pairs.append(leaders[candidates] * num_docs + doc_ids[candidates])
+        order = np.argsort(inverse, kind='stable')
+        consecutive = inverse[order[1:]] == inverse[order[:-1]]
+        pairs.append(order[:-1][consecutive] * num_docs + order[1:][consecutive])
+    # pairs found in several bands are verified once
+    pairs = np.unique(np.concatenate(pairs))
+    left, right = pairs // max(num_docs, 1), pairs % max(num_docs, 1)
+    similarity = (signatures[left] == signatures[right]).mean(axis=1)
+    verified = similarity >= threshold
+    graph = scipy.sparse.coo_matrix((np.ones(verified.sum(), dtype=np.int8), (left[verified], right[verified])),
+                                    shape=(num_docs, num_docs))
+    _, labels = scipy.sparse.csgraph.connected_components(graph, directed=False)
+    # np.unique returns the index of the first document of each group
+    _, first = np.unique(labels, return_index=True)
+    duplicates = np.ones(num_docs, dtype=bool)
+    duplicates[first] = False
+    return duplicates
@@ -1,14 +1,119 @@
 """Functions related to creating word priors for training topic models."""
 
 import numpy as np
+from gensim.corpora import HashDictionary
 
 __all__ = [
+    'SeededEta',
     'create_eta',
     'create_word_prior_matrix',
 ]
 
 
-def create_eta(keywords, vocab, num_topics, pseudo_count=1e7, normalize=True):
+class SeededEta(object):
+    """Word prior matrix stored as a constant value with the columns of seed keywords.
+
+    All columns of the prior are equal except the columns of seed keywords, so only one value of the other
+      columns and the (num_topics, num_seeds) matrix of seed columns are stored. Use `toarray`, `get_columns`
+      or `iter_chunks` to expand it when needed.
+
+    The saving only applies to callers that use the prior in this form: gensim models require the dense
+      (num_topics, num_terms) matrix, so `AuthorTopicModel.fit` expands it with `toarray` when creating the model.
+    """
+
+    def __init__(self, num_topics, num_terms, value, seed_ids, seed_values):
+        """Creates the word prior.
+
+        :param num_topics: number of topics.
+        :param num_terms: number of terms.
+        :param value: value of the columns of terms that are not seed keywords.
+        :param seed_ids: term ids of seed keywords (sorted int array).
+        :param seed_values: prior of seed keywords, array of shape (num_topics, len(seed_ids)).
+        """
+        self.num_topics = num_topics
+        self.num_terms = num_terms
+        self.value = value
+        self.seed_ids = seed_ids
+        self.seed_values = seed_values
+
+    @property
+    def shape(self):
+        """Gets shape of the expanded prior.
+
+        :return: tuple of (num_topics, num_terms).
+        """
+        return self.num_topics, self.num_terms
+
+    @property
+    def dtype(self):
+        """Gets data type of the prior.
+
+        :return: `numpy.dtype`.
+        """
+        return self.seed_values.dtype
+
+    @property
+    def nbytes(self):
+        """Gets memory of the stored prior, not of the expanded matrix.
+
+        :return: number of bytes.
+        """
+        return self.seed_ids.nbytes + self.seed_values.nbytes
+
+    def get_columns(self, term_ids):
+        """Gets the prior of the provided terms.
+
+        :param term_ids: term ids (int array).
+        :return: array of shape (num_topics, len(term_ids)).
+        """
+        term_ids = np.asarray(term_ids)
+        columns = np.full((self.num_topics, len(term_ids)), self.value, dtype=self.dtype)
+        pos = np.searchsorted(self.seed_ids, term_ids)
+        pos[pos == len(self.seed_ids)] = 0
+        is_seed = (self.seed_ids[pos] == term_ids) if len(self.seed_ids) > 0 else np.zeros(len(term_ids), bool)
+        columns[:, is_seed] = self.seed_values[:, pos[is_seed]]
+        return columns
+
+    def iter_chunks(self, chunk_size=10000):
+        """Iterates over the prior in chunks of columns.
+
+        :param chunk_size: number of columns in each chunk.
+        :return: generator of (start, array of shape (num_topics, chunk_size)) tuples.
+        """
+        for start in range(0, self.num_terms, chunk_size):
+            yield start, self.get_columns(np.arange(start, min(start + chunk_size, self.num_terms)))
+
+    def toarray(self, dtype=None):
+        """Expands the prior to a dense matrix.
+
+        :param dtype: data type of the matrix, defaults to the data type of the prior.
+        :return: array of shape (num_topics, num_terms).
+        """
+        eta = np.full(self.shape, self.value, dtype=self.dtype if dtype is None else dtype)
+        eta[:, self.seed_ids] = self.seed_values
+        return eta
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray(dtype=dtype)
+
+
+def _get_seed_index(keywords, vocab):
+    """Gets (topic id, term id) of the seed keywords in vocab."""
+    topic_ids, term_ids = [], []
+    for topic_id, tokens in enumerate(keywords.values()):
+        for token in tokens:
+            if isinstance(vocab, HashDictionary):
+                # hashed tokens are always in vocab
+                term_id = vocab.restricted_hash(token)
+            else:
+                term_id = vocab.token2id.get(token)
+            if term_id is not None:
+                topic_ids.append(topic_id)
+                term_ids.append(term_id)
+    return np.array(topic_ids, dtype=np.int64), np.array(term_ids, dtype=np.int64)
+
+
+def create_eta(keywords, vocab, num_topics, pseudo_count=1e7, normalize=True, dtype=np.float64, sparse=False):
     """Creates word prior matrix.
 
     :param keywords:
@@ -16,25 +121,29 @@ def create_eta(keywords, vocab, num_topics, pseudo_count=1e7, normalize=True):
     :param num_topics:
     :param pseudo_count:
     :param normalize:
-    :param beta:
+    :param dtype: data type of the matrix, e.g., `np.float32` halves its memory.
+    :param sparse: whether to return a `SeededEta` that only stores the columns of seed keywords. Models that
+        require the dense matrix still expand it, see `SeededEta`.
     :return:
     """
     # smoothing parameter
     beta = 0.01
-    # create a (ntopics, nterms) matrix and fill with 1
-    eta = np.full(shape=(num_topics, len(vocab)), fill_value=beta)
     if keywords is not None:
-        # for each topic in the seed dict
-        topic2id = {topic: i for i, topic in enumerate(keywords)}
-        # for each topic in the seed dict
-        for topic, tokens in keywords.items():
-            # for each seed token that is in vocab
-            for token in tokens:
-                if token in vocab.token2id:
-                    eta[topic2id[topic], vocab.token2id[token]] = pseudo_count + beta
+        topic_ids, term_ids = _get_seed_index(keywords, vocab)
+    else:
+        topic_ids, term_ids = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # seed columns of a (ntopics, nterms) matrix filled with beta
+    seed_ids, seed_pos = np.unique(term_ids, return_inverse=True)
+    seed_values = np.full((num_topics, len(seed_ids)), fill_value=beta, dtype=dtype)
+    seed_values[topic_ids, seed_pos.ravel()] = pseudo_count + beta
+    value = np.full((num_topics, 1), fill_value=beta, dtype=dtype)
     if normalize or (keywords is None):
-        eta = np.divide(eta, eta.sum(axis=0))
-    return eta
+        seed_values = np.divide(seed_values, seed_values.sum(axis=0))
+        value = np.divide(value, value.sum(axis=0))
+    eta = SeededEta(num_topics, len(vocab), value[0, 0], seed_ids, seed_values)
+    if sparse:
+        return eta
+    return eta.toarray()
 
 
 # alias
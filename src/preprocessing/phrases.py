@@ -0,0 +1,192 @@
+"""Sharded training and parallel application of phrase models.
+
+Unigram and bigram counts of `gensim.models.Phrases` are sums over documents, so they are counted over chunks
+  of documents in a pool of workers and merged into a single model. The merged model has the same counts (and
+  exports the same phrases) as a model trained serially over all documents, as long as the vocabulary stays
+  below `max_vocab_size` (40M unigrams and bigrams by default) and is never pruned.
+
+Trained models can be persisted by the fingerprint of the tokenized documents and the training parameters
+  (see `get_phrases_fingerprint`), so that training is skipped when preprocessing the same documents again.
+"""
+import functools
+import hashlib
+import itertools
+import json
+import os
+
+import gensim
+import tqdm
+from gensim.models import Phrases
+from gensim.models.phrases import ENGLISH_CONNECTOR_WORDS
+
+from src.config import config
+from src.utils import parallel
+
+__all__ = [
+    'PHRASES_PARAMS',
+    'get_phrases_cache_path',
+    'get_phrases_fingerprint',
+    'train_phrases',
+    'apply_phrases',
+    'load_or_train_phrases',
+]
+
+# parameters of phrase models trained on the documents
+PHRASES_PARAMS = {
+    'min_count': 10,
+    'threshold': 1,
+    'connector_words': ENGLISH_CONNECTOR_WORDS,
+}
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# phrase model of worker processes, set by `_init_worker`
+_worker_phrases_model = None
+
+
+def get_phrases_cache_path(cache_path=None):
+    """Gets path to the directory of persisted phrase models.
+
+    :param cache_path: path to the directory, defaults to `data/interim/phrases` in project path.
+    :return: path to the directory.
+    """
+    if cache_path is None:
+        cache_path = os.path.join(config['DEFAULT']['project_path'], 'data', 'interim', 'phrases')
+    return cache_path
+
+
+def get_phrases_fingerprint(tokenized_docs, **params):
+    """Gets the fingerprint of the tokenized documents and parameters a phrase model is trained with.
+
+    :param tokenized_docs: iterable of lists of tokens.
+    :param params: parameters of `Phrases`, defaults to `PHRASES_PARAMS`.
+    :return: fingerprint (hex str).
+    """
+    params = dict(PHRASES_PARAMS, **params)
+    params['connector_words'] = sorted(params['connector_words'])
+    sha1 = hashlib.sha1(json.dumps({'gensim': gensim.__version__, 'params': params}, sort_keys=True).encode('utf-8'))
+    for tokens in tokenized_docs:
+        sha1.update(' '.join(tokens).encode('utf-8'))
+        sha1.update(b'\n')
+    return sha1.hexdigest()
+
+
+def _iter_chunks(items, chunk_size):
+    items = iter(items)
+    return iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+
+def _learn_vocab(tokenized_docs, max_vocab_size, delimiter, connector_words):
+    min_reduce, vocab, total_words = Phrases._learn_vocab(
+        tokenized_docs, max_vocab_size=max_vocab_size, delimiter=delimiter, connector_words=connector_words,
+        progress_per=DEFAULT_CHUNK_SIZE,
+    )
+    return min_reduce, vocab, total_words, len(tokenized_docs)
+
+
+def train_phrases(tokenized_docs, num_workers=0, chunk_size=DEFAULT_CHUNK_SIZE, verbose=False, **params):
+    """Trains a phrase model by merging the counts of chunks of documents.
+
+    :param tokenized_docs: iterable of lists of tokens.
+    :param num_workers: number of processes to count chunks with, 0 counts in the calling process.
+        None uses all CPUs, see `parallel.get_num_workers`.
+    :param chunk_size: number of documents counted at once.
+    :param verbose: whether to show progress in terminal.
+    :param params: parameters of `Phrases`, defaults to `PHRASES_PARAMS`.
+    :return: `Phrases` model.
+    """
+    phrases_model = Phrases(**dict(PHRASES_PARAMS, **params))
+    func = functools.partial(_learn_vocab, max_vocab_size=phrases_model.max_vocab_size,
+                             delimiter=phrases_model.delimiter, connector_words=phrases_model.connector_words)
+    chunks = _iter_chunks(tokenized_docs, chunk_size)
+    if num_workers == 0:
+        results = map(func, chunks)
+    else:
+        results = parallel.imap(func, chunks, num_workers=num_workers, executor='process')
+    pbar = tqdm.tqdm(desc='Learning Phrases', unit='docs') if verbose else None
+    for min_reduce, vocab, total_words, num_docs in results:
+        # merged as in `Phrases.add_vocab`
+        phrases_model.corpus_word_count += total_words
+        phrases_model.min_reduce = max(phrases_model.min_reduce, min_reduce)
+        if phrases_model.vocab:
+            for word, count in vocab.items():
+                phrases_model.vocab[word] = phrases_model.vocab.get(word, 0) + count
+            if len(phrases_model.vocab) > phrases_model.max_vocab_size:
+                gensim.utils.prune_vocab(phrases_model.vocab, phrases_model.min_reduce)
+                phrases_model.min_reduce += 1
+        else:
+            phrases_model.vocab = vocab
+        if pbar is not None:
+            pbar.update(num_docs)
+    if pbar is not None:
+        pbar.close()
+    return phrases_model
+
+
+def _init_worker(phrases_model):
+    global _worker_phrases_model
+    _worker_phrases_model = phrases_model
+
+
+def _apply_chunk(tokenized_docs, phrases_model=None):
+    if phrases_model is None:
+        phrases_model = _worker_phrases_model
+    delimiter = phrases_model.delimiter
+    return [[token for token in phrases_model[tokens] if delimiter in token] for tokens in tokenized_docs]
+
+
+def apply_phrases(phrases_model, tokenized_docs, num_workers=0, chunk_size=DEFAULT_CHUNK_SIZE, verbose=False):
+    """Extracts the phrases of documents.
+
+    :param phrases_model: `Phrases` or `FrozenPhrases` model. `Phrases` are frozen before use, which extracts
+        the same phrases faster.
+    :param tokenized_docs: iterable of lists of tokens.
+    :param num_workers: number of processes to extract phrases with, 0 extracts in the calling process.
+        None uses all CPUs, see `parallel.get_num_workers`.
+    :param chunk_size: number of documents sent to a worker at once.
+    :param verbose: whether to show progress in terminal.
+    :return: generator of lists of phrases of each document, in the order of the documents.
+    """
+    if isinstance(phrases_model, Phrases):
+        phrases_model = phrases_model.freeze()
+    chunks = _iter_chunks(tokenized_docs, chunk_size)
+    if num_workers == 0:
+        results = map(functools.partial(_apply_chunk, phrases_model=phrases_model), chunks)
+    else:
+        results = parallel.imap(_apply_chunk, chunks, num_workers=num_workers, executor='process',
+                                initializer=_init_worker, initargs=(phrases_model,))
+    pbar = tqdm.tqdm(desc='Extracting Phrases', unit='docs') if verbose else None
+    for phrases in results:
+        if pbar is not None:
+            pbar.update(len(phrases))
+        yield from phrases
+    if pbar is not None:
+        pbar.close()
+
+
+def load_or_train_phrases(tokenized_docs, cache_path=None, num_workers=0, chunk_size=DEFAULT_CHUNK_SIZE,
+                          verbose=False, **params):
+    """Loads the phrase model persisted for the documents or trains and persists one.
+
+    :param tokenized_docs: list of lists of tokens.
+    :param cache_path: directory of persisted phrase models, see `get_phrases_cache_path`.
+    :param num_workers: number of processes to train with, see `train_phrases`.
+    :param chunk_size: number of documents counted at once.
+    :param verbose: whether to show progress in terminal.
+    :param params: parameters of `Phrases`, defaults to `PHRASES_PARAMS`.
+    :return: `Phrases` model.
+    """
+    cache_path = get_phrases_cache_path(cache_path)
+    fingerprint = get_phrases_fingerprint(tokenized_docs, **params)
+    path = os.path.join(cache_path, '{}.pkl'.format(fingerprint))
+    if os.path.exists(path):
+        return Phrases.load(path)
+    phrases_model = train_phrases(tokenized_docs, num_workers=num_workers, chunk_size=chunk_size, verbose=verbose,
+                                  **params)
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+    # write to a temporary file first so that concurrent runs never read a partial model
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    phrases_model.save(tmp_path)
+    os.replace(tmp_path, path)
+    return phrases_model
@@ -0,0 +1,70 @@
+"""Random sampling of documents by label."""
+import numpy as np
+
+__all__ = [
+    'SAMPLING_STRATEGIES',
+    'get_sampling_targets',
+    'random_undersample',
+]
+
+SAMPLING_STRATEGIES = ['majority', 'not minority', 'not majority', 'all', 'auto']
+
+
+def get_sampling_targets(counts, sampling_strategy='majority'):
+    """Gets the number of samples to keep of each class.
+
+    :param counts: number of samples of each class (array).
+    :param sampling_strategy: classes to undersample to the size of the minority class, one of
+        `SAMPLING_STRATEGIES` ('auto' is 'not minority'), or a list of numbers of samples to keep of each class.
+        Follows the strategies of imblearn's `RandomUnderSampler`.
+    :return: number of samples to keep of each class (array).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if not isinstance(sampling_strategy, str):
+        targets = np.asarray(sampling_strategy, dtype=np.int64)
+        if targets.shape != counts.shape:
+            raise ValueError('sampling strategy must provide a number of samples for each class.')
+        if np.any(targets > counts) or np.any(targets < 0):
+            raise ValueError('number of samples must be between 0 and the number of samples of the class.')
+        return targets
+    if sampling_strategy not in SAMPLING_STRATEGIES:
+        raise ValueError('sampling strategy should be one of {}.'.format(SAMPLING_STRATEGIES))
+    targets = counts.copy()
+    if len(counts) == 0:
+        return targets
+    minority, majority = np.argmin(counts), np.argmax(counts)
+    selected = np.ones(len(counts), dtype=bool)
+    if sampling_strategy == 'majority':
+        selected[:] = False
+        selected[majority] = True
+    elif sampling_strategy in ['not minority', 'auto']:
+        selected[minority] = False
+    elif sampling_strategy == 'not majority':
+        selected[majority] = False
+    targets[selected] = counts[minority]
+    return targets
+
+
+def random_undersample(labels, sampling_strategy='majority', random_state=None):
+    """Randomly undersamples classes of labels without replacement.
+
+    :param labels: label of each sample (array-like of int or str).
+    :param sampling_strategy: classes to undersample, see `get_sampling_targets`. Use a dict of label to
+        number of samples to provide the number of samples of each class, missing labels are kept.
+    :param random_state: seed or `numpy.random.Generator`.
+    :return: indices of the selected samples in ascending order (int64 array).
+    """
+    labels = np.asarray(labels)
+    classes, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    if isinstance(sampling_strategy, dict):
+        sampling_strategy = [sampling_strategy.get(c, n) for c, n in zip(classes.tolist(), counts.tolist())]
+    targets = get_sampling_targets(counts, sampling_strategy)
+    rng = np.random.default_rng(random_state)
+    # samples of each class in random order, the first samples of each class up to the target are kept
+    order = rng.permutation(len(labels))
+    order = order[np.argsort(inverse[order], kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ranks = np.arange(len(labels)) - starts[inverse[order]]
+    selected = order[ranks < targets[inverse[order]]]
+    return np.sort(selected)
@@ -0,0 +1,158 @@
+"""Out-of-core preprocessing of documents for corpora that do not fit in memory.
+
+Documents are read from an iterator in chunks and processed in two passes over files on disk:
+  1. documents are tokenized, tokens are written to disk and phrases are counted;
+  2. phrases are added to the tokens while building the dictionary and the bag of words is written to a
+     Matrix Market file (`gensim.corpora.MmCorpus`).
+Memory use depends on the chunk size, the vocabulary and `author2doc` but not on the tokens of the corpus.
+"""
+import itertools
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+import tqdm
+from gensim.corpora import Dictionary, HashDictionary, MmCorpus
+from gensim.models import Phrases
+
+from src.preprocessing.documents import _get_corpus_documents, _load_phrases_model
+from src.preprocessing.phrases import PHRASES_PARAMS
+from src.preprocessing.vocabulary import prune_dictionary
+from src.utils import jsonline
+
+__all__ = [
+    'TokenizedDocuments',
+    'preprocess_documents_streaming',
+]
+
+DEFAULT_CHUNK_SIZE = 10000
+
+_CORPUS_FILENAME = 'corpus.mm'
+
+_TOKENS_FILENAME = 'tokens.jsonl'
+
+_RAW_TOKENS_FILENAME = 'tokens.raw.jsonl'
+
+
+class TokenizedDocuments(object):
+    """Tokens of documents stored in a jsonline file, can be iterated multiple times."""
+
+    def __init__(self, path, num_docs=None):
+        """Opens the tokenized documents.
+
+        :param path: path to the jsonline file with a list of tokens in each line.
+        :param num_docs: number of documents in the file, counted on first use of `len` if not provided.
+        """
+        self.path = path
+        self._num_docs = num_docs
+
+    def __len__(self):
+        if self._num_docs is None:
+            self._num_docs = sum(1 for _ in jsonline.iter_lines(self.path))
+        return self._num_docs
+
+    def __iter__(self):
+        return jsonline.load(self.path, decoder='auto')
+
+
+def _write_tokens(fp, tokens):
+    fp.write(json.dumps(tokens))
+    fp.write('\n')
+
+
+def preprocess_documents_streaming(docs, output_path=None, phrases_model=None, dictionary=None, author2doc=None,
+                                   chunk_size=DEFAULT_CHUNK_SIZE, verbose=False, token_cache=None, min_df=0, max_df=1.0,
+                                   keep_n=None, keywords=None, hash_buckets=None):
+    """Preprocess documents out-of-core, see `preprocess_documents`.
+
+    Files are written to `output_path`. They back the returned corpus and tokenized documents, so the
+      directory should be kept until these are no longer used.
+
+    :param docs: iterable of documents, consumed once.
+    :param output_path: directory to write the corpus to, defaults to a new temporary directory.
+    :param phrases_model: a prebuilt phrase model or path to one. Trained on the documents if None.
+    :param dictionary: dictionary. Created from the documents if None.
+    :param author2doc: mapping of authors to document indices. Created from the documents if None.
+    :param chunk_size: number of documents tokenized at once.
+    :param verbose: whether to show progress in terminal.
+    :param token_cache: `TokenCache`, path to the cache database or True for the default cache.
+    :param min_df: minimum document frequency of token.
+    :param max_df: maximum document frequency of token (as a fraction of number of documents).
+    :param keep_n: number of words to keep in dictionary. The bag of words is written again after pruning.
+    :param keywords: mapping of topics to seed keywords that are never pruned.
+    :param hash_buckets: if provided, tokens are hashed to this number of ids with a `HashDictionary`.
+    :return: tuple of (corpus, author2doc, tokenized_docs, dictionary, phrases_model) where corpus is
+        a `MmCorpus` and tokenized_docs is a `TokenizedDocuments`.
+    """
+    if output_path is None:
+        output_path = tempfile.mkdtemp(prefix='corpus-')
+    os.makedirs(output_path, exist_ok=True)
+    phrases_model = _load_phrases_model(phrases_model)
+    train_phrases = phrases_model is None
+    if train_phrases:
+        phrases_model = Phrases(**PHRASES_PARAMS)
+    build_author2doc = author2doc is None
+    if build_author2doc:
+        author2doc = defaultdict(list)
+    # first pass: tokens and phrase counts
+    raw_tokens_path = os.path.join(output_path, _RAW_TOKENS_FILENAME)
+    docs = iter(docs)
+    num_docs = 0
+    pbar = tqdm.tqdm(desc='Extracting Tokens', unit='docs') if verbose else None
+    with open(raw_tokens_path, 'w', encoding='utf-8') as fp:
+        for chunk in iter(lambda: list(itertools.islice(docs, chunk_size)), []):
+            chunk = _get_corpus_documents(chunk, token_cache=token_cache)
+            tokenized_chunk = [list(doc.tokens) for doc in chunk]
+            for i, (doc, tokens) in enumerate(zip(chunk, tokenized_chunk)):
+                _write_tokens(fp, tokens)
+                if build_author2doc:
+                    author2doc[doc.author_id].append(num_docs + i)
+            if train_phrases:
+                phrases_model.add_vocab(tokenized_chunk)
+            num_docs += len(chunk)
+            if pbar is not None:
+                pbar.update(len(chunk))
+    if pbar is not None:
+        pbar.close()
+    # frozen phrases extract the same phrases faster
+    frozen_phrases_model = phrases_model.freeze() if isinstance(phrases_model, Phrases) else phrases_model
+    if build_author2doc:
+        author2doc = dict(author2doc)
+    # second pass: phrases, dictionary and bag of words
+    update_dictionary = dictionary is None
+    if update_dictionary and (hash_buckets is not None):
+        dictionary = HashDictionary(id_range=hash_buckets, debug=False)
+    elif update_dictionary:
+        dictionary = Dictionary()
+    tokens_path = os.path.join(output_path, _TOKENS_FILENAME)
+
+    def _iter_bow(fp):
+        raw_tokenized_docs = TokenizedDocuments(raw_tokens_path, num_docs=num_docs)
+        if verbose:
+            raw_tokenized_docs = tqdm.tqdm(raw_tokenized_docs, desc='Extracting Bag of Words')
+        for tokens in raw_tokenized_docs:
+            tokens.extend(token for token in frozen_phrases_model[tokens] if '_' in token)
+            _write_tokens(fp, tokens)
+            yield dictionary.doc2bow(tokens, allow_update=update_dictionary)
+
+    corpus_path = os.path.join(output_path, _CORPUS_FILENAME)
+    with open(tokens_path, 'w', encoding='utf-8') as fp:
+        # number of terms is only known at the end when the dictionary is built from the documents
+        MmCorpus.serialize(corpus_path, _iter_bow(fp),
+                           id2word=None if update_dictionary and (hash_buckets is None) else dictionary)
+    os.remove(raw_tokens_path)
+    tokenized_docs = TokenizedDocuments(tokens_path, num_docs=num_docs)
+    if update_dictionary and (hash_buckets is None):
+        num_pruned = prune_dictionary(dictionary, min_df=min_df, max_df=max_df, keep_n=keep_n, keywords=keywords)
+        if num_pruned > 0:
+            # third pass: bag of words with the ids of the pruned dictionary
+            if verbose:
+                print('{} tokens pruned from a vocabulary of {} tokens.'.format(num_pruned,
+                                                                               num_pruned + len(dictionary)))
+            bow = (dictionary.doc2bow(tokens) for tokens in tokenized_docs)
+            MmCorpus.serialize(corpus_path, bow, id2word=dictionary)
+    if len(dictionary) > 0:
+        _ = dictionary[0]  # initialize dictionary.id2token
+    corpus = MmCorpus(corpus_path)
+    return corpus, author2doc, tokenized_docs, dictionary, phrases_model
@@ -0,0 +1,102 @@
+"""Vocabulary pruning and memory estimates of topic models.
+
+The topic-term matrices of topic models (the word prior `eta`, the sufficient statistics and the expected
+  log topic-term distribution of gensim models) are dense matrices of shape (num_topics, num_terms), so
+  the memory of a model grows with the size of the vocabulary. The vocabulary can be pruned by document
+  frequency (see `prune_dictionary`) or bounded by hashing tokens to a fixed number of buckets with a
+  `gensim.corpora.HashDictionary`.
+"""
+import numpy as np
+
+__all__ = [
+    'get_keep_tokens',
+    'is_pruned',
+    'prune_dictionary',
+    'get_model_memory',
+    'format_model_memory',
+]
+
+
+def get_keep_tokens(keywords):
+    """Gets the tokens of seed keywords, which are never pruned.
+
+    Keywords of multiple words are also kept as phrases (words joined with '_').
+
+    :param keywords: mapping of topics to seed keywords.
+    :return: set of tokens.
+    """
+    keep_tokens = set()
+    if keywords is None:
+        return keep_tokens
+    for values in keywords.values():
+        for value in values:
+            words = value.lower().split()
+            keep_tokens.update(words)
+            keep_tokens.add('_'.join(words))
+    return keep_tokens
+
+
+def is_pruned(min_df=0, max_df=1.0, keep_n=None):
+    """Checks whether pruning parameters remove any token.
+
+    :param min_df: minimum document frequency of tokens.
+    :param max_df: maximum document frequency of tokens (as a fraction of number of documents).
+    :param keep_n: number of most frequent tokens to keep, all tokens if None.
+    :return: True if the parameters may remove tokens.
+    """
+    return (min_df > 0) or (max_df < 1.0) or (keep_n is not None)
+
+
+def prune_dictionary(dictionary, min_df=0, max_df=1.0, keep_n=None, keywords=None):
+    """Removes infrequent and frequent tokens from the dictionary, except tokens of seed keywords.
+
+    Token ids are reassigned without gaps, see `Dictionary.filter_extremes`.
+
+    :param dictionary: `Dictionary` to prune in place.
+    :param min_df: minimum document frequency of tokens.
+    :param max_df: maximum document frequency of tokens (as a fraction of number of documents).
+    :param keep_n: number of most frequent tokens to keep, all tokens if None. Seed keywords count first.
+    :param keywords: mapping of topics to seed keywords, see `get_keep_tokens`.
+    :return: number of tokens removed.
+    """
+    if not is_pruned(min_df, max_df, keep_n):
+        return 0
+    num_terms = len(dictionary)
+    dictionary.filter_extremes(no_below=min_df, no_above=max_df, keep_n=keep_n,
+                               keep_tokens=get_keep_tokens(keywords))
+    return num_terms - len(dictionary)
+
+
+def get_model_memory(num_terms, num_topics, num_authors=0, dtype=np.float64):
+    """Estimates the memory of the dense matrices of an author-topic model.
+
+    Counts the word prior (`eta`), the sufficient statistics and expected log topic-term distribution
+      (num_topics x num_terms each) and the author-topic matrix (num_authors x num_topics).
+
+    :param num_terms: size of the vocabulary.
+    :param num_topics: number of topics.
+    :param num_authors: number of authors.
+    :param dtype: data type of the matrices.
+    :return: dict of matrix name to number of bytes, with the sum in 'total'.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    topic_terms = num_topics * num_terms * itemsize
+    memory = {
+        'eta': topic_terms,
+        'sstats': topic_terms,
+        'expElogbeta': topic_terms,
+        'gamma': num_authors * num_topics * itemsize,
+    }
+    memory['total'] = sum(memory.values())
+    return memory
+
+
+def format_model_memory(num_terms, num_topics, num_authors=0, dtype=np.float64):
+    """Formats the vocabulary size and memory estimate of an author-topic model, see `get_model_memory`.
+
+    :return: description (str).
+    """
+    memory = get_model_memory(num_terms, num_topics, num_authors=num_authors, dtype=dtype)
+    return 'Vocabulary of {} tokens, {} topics and {} authors use {:.1f} MB of model memory ({}).'.format(
+        num_terms, num_topics, num_authors, memory['total'] / 1024 / 1024,
+        ', '.join('{} {:.1f} MB'.format(k, v / 1024 / 1024) for k, v in memory.items() if k != 'total'))
@@ -1,20 +1,315 @@
+"""Streaming reader for JSON line files.
+
+Files are read line by line through a fixed size buffer so that memory use is bounded by the
+  longest line of the file rather than by the size of the file.
+
+Files compressed with gzip (`.jsonl.gz`), bzip2 (`.jsonl.bz2`) or xz (`.jsonl.xz`) are decompressed while
+  streaming. A block-compressed gzip file (see `compress`) is a valid gzip file made of independent members
+  holding whole lines, with an index (`<path>.idx`) that allows reading a range of lines by decompressing
+  only the blocks that contain them.
+"""
+import bisect
+import bz2
+import gzip
 import json
+import lzma
+import os
 
 from src.errors import JSONLineDecodeError
 
+__all__ = [
+    'load',
+    'load_lines',
+    'iter_lines',
+    'open_file',
+    'find_file',
+    'split_extension',
+    'compress',
+    'load_block_index',
+    'read_block',
+    'get_decoder',
+]
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+JSONLINE_EXTENSIONS = ('.jsonl', '.jsonline')
+
+COMPRESSION_EXTENSIONS = ('', '.gz', '.bz2', '.xz')
+
+BLOCK_INDEX_EXTENSION = '.idx'
+
+_openers = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def _json_loads(line):
+    # decoding explicitly is notably faster than letting `json.loads` detect the encoding of bytes
+    return json.loads(line.decode('utf-8'))
+
+
+def _load_orjson():
+    import orjson
+    return orjson.loads
+
+
+def _load_ujson():
+    import ujson
+    return ujson.loads
+
+
+_decoders = {
+    'json': lambda: _json_loads,
+    'orjson': _load_orjson,
+    'ujson': _load_ujson,
+}
 
-def load(path):
-    """Loads a jsonline file.
+
+def get_decoder(decoder=None):
+    """Gets the function used to decode a single JSON line.
+
+    :param decoder: name of the decoder backend {'json', 'orjson', 'ujson', 'auto'} or a callable
+        taking the raw line (bytes) and returning the decoded object. Defaults to 'json'.
+        'auto' picks the fastest backend that is installed.
+    :return: decoder function.
+    """
+    if decoder is None:
+        decoder = 'json'
+    if callable(decoder):
+        return decoder
+    if decoder == 'auto':
+        for name in ('orjson', 'ujson'):
+            try:
+                return _decoders[name]()
+            except ImportError:
+                pass
+        return _json_loads
+    if decoder not in _decoders:
+        raise ValueError('invalid decoder: {}'.format(decoder))
+    return _decoders[decoder]()
+
+
+def split_extension(path):
+    """Splits the jsonline extension (with the compression extension if any) from the path.
+
+    :param path: path to a file.
+    :return: tuple of (root, extension), extension is None if the path is not a jsonline file.
+    """
+    for ext in JSONLINE_EXTENSIONS:
+        for compression in COMPRESSION_EXTENSIONS:
+            if path.endswith(ext + compression):
+                return path[:-len(ext + compression)], ext + compression
+    return path, None
+
+
+def find_file(root, ext='.jsonl'):
+    """Finds the jsonline file with the provided root, preferring uncompressed files.
+
+    :param root: path to the file without extension.
+    :param ext: jsonline extension of the file.
+    :return: path to the existing file, or the path to the uncompressed file if none exists.
+    """
+    for compression in COMPRESSION_EXTENSIONS:
+        path = root + ext + compression
+        if os.path.exists(path):
+            return path
+    return root + ext
+
+
+def open_file(path, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Opens a (possibly compressed) jsonline file for reading in binary mode.
 
     :param path: path to jsonline file.
+    :param buffer_size: size of the read buffer in bytes for uncompressed files.
+    :return: file object.
+    """
+    _, ext = split_extension(path)
+    if ext is not None:
+        for compression, opener in _openers.items():
+            if ext.endswith(compression):
+                return opener(path, 'rb')
+    return open(path, 'rb', buffering=buffer_size)
+
+
+def iter_lines(fp, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Iterates over non-empty lines of a jsonline file.
+
+    :param fp: path to jsonline file or a file object opened in binary mode.
+    :param buffer_size: size of the read buffer in bytes.
+    :return: generator of (line number, byte offset, line) tuples. Line numbers start from 1.
+        Byte offsets of compressed files are offsets in the decompressed content.
     """
-    if path.endswith('.jsonl') or path.endswith('.jsonline'):
-        with open(path) as fp:
-            for line in fp.read().strip().split('\n'):
+    if isinstance(fp, str):
+        with open_file(fp, buffer_size=buffer_size) as f:
+            yield from iter_lines(f, buffer_size=buffer_size)
+        return
+    offset = 0
+    for lineno, line in enumerate(fp, start=1):
+        line_offset = offset
+        offset += len(line)
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        yield lineno, line_offset, line
+
+
+def _decode_lines(lines, decoder=None, contains=None):
+    loads = get_decoder(decoder)
+    if isinstance(contains, str):
+        contains = contains.encode('utf-8')
+    for lineno, offset, line in lines:
+        if (contains is not None) and (contains not in line):
+            continue
+        try:
+            yield loads(line)
+        except ValueError as e:
+            msg = 'Error in line {} (byte offset {}) with content: {}'.format(
+                lineno, offset, line.decode('utf-8', errors='replace'))
+            raise JSONLineDecodeError(msg, lineno=lineno, offset=offset) from e
+
+
+def load(path, decoder=None, buffer_size=DEFAULT_BUFFER_SIZE, contains=None):
+    """Loads a jsonline file.
+
+    :param path: path to jsonline file, optionally compressed.
+    :param decoder: JSON decoder backend, see `get_decoder`.
+    :param buffer_size: size of the read buffer in bytes.
+    :param contains: if provided, lines that do not contain this substring (str or bytes) are skipped
+        before decoding. Useful as a cheap pre-filter for records that cannot match a predicate.
+    """
+    if split_extension(path)[1] is not None:
+        yield from _decode_lines(iter_lines(path, buffer_size=buffer_size), decoder=decoder, contains=contains)
+
+
+def _write_block(fp, lines, compresslevel):
+    data = b''.join(lines)
+    compressed = gzip.compress(data, compresslevel=compresslevel, mtime=0)
+    fp.write(compressed)
+    return len(compressed), len(data)
+
+
+def compress(path, output_path=None, block_size=DEFAULT_BLOCK_SIZE, compresslevel=6):
+    """Writes a block-compressed gzip copy of a jsonline file with its block index.
+
+    Each block is an independent gzip member of whole lines of about `block_size` uncompressed bytes,
+      so the output can also be read by any gzip reader. The index is written to `<output_path>.idx`.
+
+    :param path: path to jsonline file, optionally compressed.
+    :param output_path: path to the output file, defaults to the path of the uncompressed file with '.gz'.
+    :param block_size: number of uncompressed bytes per block.
+    :param compresslevel: gzip compression level.
+    :return: path to the output file.
+    """
+    if output_path is None:
+        root, ext = split_extension(path)
+        if ext is None:
+            raise ValueError('not a jsonline file: {}'.format(path))
+        output_path = '{}.{}.gz'.format(root, ext.split('.')[1])
+    blocks = []
+    tmp_path = '{}.tmp'.format(output_path)
+    with open_file(path) as src, open(tmp_path, 'wb') as dst:
+        lines, lines_size, num_lines, offset = [], 0, 0, 0
+        for line in src:
+            lines.append(line)
+            lines_size += len(line)
+            num_lines += 1
+            if lines_size >= block_size:
+                block_offset = dst.tell()
+                compressed_size, size = _write_block(dst, lines, compresslevel)
+                blocks.append([block_offset, compressed_size, num_lines - len(lines), len(lines), offset])
+                offset += size
+                lines, lines_size = [], 0
+        if lines:
+            block_offset = dst.tell()
+            compressed_size, size = _write_block(dst, lines, compresslevel)
+            blocks.append([block_offset, compressed_size, num_lines - len(lines), len(lines), offset])
+            offset += size
+        dst_size = dst.tell()
+    with open(output_path + BLOCK_INDEX_EXTENSION, 'w', encoding='utf-8') as fp:
+        json.dump({'num_lines': num_lines, 'size': offset, 'compressed_size': dst_size, 'blocks': blocks}, fp)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def load_block_index(path):
+    """Loads the block index of a block-compressed jsonline file.
+
+    :param path: path to the block-compressed file.
+    :return: dict with keys ['num_lines', 'size', 'compressed_size', 'blocks'] where each block is a list of
+        [compressed offset, compressed size, first line (from 0), number of lines, uncompressed offset],
+        or None if the file has no index or the index does not match the file.
+    """
+    index_path = path + BLOCK_INDEX_EXTENSION
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r', encoding='utf-8') as fp:
+        index = json.load(fp)
+    if index.get('compressed_size') != os.path.getsize(path):
+        return None
+    return index
+
+
+def read_block(fp, block):
+    """Reads and decompresses a single block.
+
+    :param fp: block-compressed file opened in binary mode.
+    :param block: block entry of the index.
+    :return: uncompressed content of the block (bytes).
+    """
+    fp.seek(block[0])
+    return gzip.decompress(fp.read(block[1]))
+
+
+def _iter_block_lines(path, index, start, stop):
+    first_lines = [block[2] for block in index['blocks']]
+    block_id = max(bisect.bisect_right(first_lines, start) - 1, 0)
+    with open(path, 'rb') as fp:
+        for block in index['blocks'][block_id:]:
+            if block[2] >= stop:
+                break
+            offset = block[4]
+            for i, line in enumerate(read_block(fp, block).splitlines(keepends=True)):
+                line_offset, lineno = offset, block[2] + i
+                offset += len(line)
+                if lineno < start:
+                    continue
+                if lineno >= stop:
+                    break
                 line = line.strip()
                 if len(line) == 0:
                     continue
-                try:
-                    yield json.loads(line)
-                except json.JSONDecodeError as e:
-                    raise JSONLineDecodeError('Error in line with content: {}'.format(line))
+                yield lineno + 1, line_offset, line
+
+
+def _iter_range_lines(path, start, stop):
+    for lineno, offset, line in iter_lines(path):
+        if lineno > stop:
+            break
+        if lineno > start:
+            yield lineno, offset, line
+
+
+def load_lines(path, start, stop=None, decoder=None):
+    """Loads a range of lines of a jsonline file.
+
+    Block-compressed files with an index only decompress the blocks containing the lines,
+      other files are read sequentially up to `stop`.
+
+    :param path: path to jsonline file, optionally compressed.
+    :param start: index of the first line to load (from 0).
+    :param stop: index after the last line to load, defaults to `start + 1`.
+    :param decoder: JSON decoder backend, see `get_decoder`.
+    :return: generator of records of the non-empty lines in the range.
+    """
+    if stop is None:
+        stop = start + 1
+    index = load_block_index(path) if path.endswith('.gz') else None
+    if index is not None:
+        lines = _iter_block_lines(path, index, start, stop)
+    else:
+        lines = _iter_range_lines(path, start, stop)
+    yield from _decode_lines(lines, decoder=decoder)
@@ -0,0 +1,78 @@
+"""Helpers for running functions over items in parallel with bounded memory."""
+import collections
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+__all__ = [
+    'imap',
+    'get_num_workers',
+]
+
+_executors = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+
+def get_num_workers(num_workers=None):
+    """Gets the number of workers to use.
+
+    :param num_workers: number of workers. None or negative values are relative to the number of CPUs,
+        e.g., -1 uses all CPUs.
+    :return: number of workers.
+    """
+    cpu_count = os.cpu_count() or 1
+    if num_workers is None:
+        return cpu_count
+    if num_workers < 0:
+        return max(1, cpu_count + 1 + num_workers)
+    return max(1, num_workers)
+
+
+def imap(func, iterable, num_workers=None, prefetch=None, ordered=True, executor='thread', initializer=None,
+         initargs=()):
+    """Applies `func` to each item of `iterable` in a pool of workers.
+
+    At most `prefetch` items are submitted to the pool at any time, so the number of results held in
+      memory is bounded irrespective of the number of items.
+
+    :param func: function to apply. Should be picklable if `executor` is 'process'.
+    :param iterable: items to process.
+    :param num_workers: number of workers, see `get_num_workers`.
+    :param prefetch: maximum number of items in flight. Defaults to twice the number of workers.
+    :param ordered: whether to return results in the order of the input items.
+        If False results are returned as soon as they are available.
+    :param executor: type of pool to use {'thread', 'process'}.
+    :param initializer: callable run once in each worker when it starts.
+    :param initargs: arguments passed to `initializer`.
+    :return: generator of results.
+    """
+    if executor not in _executors:
+        raise ValueError('invalid executor: {}'.format(executor))
+    num_workers = get_num_workers(num_workers)
+    if prefetch is None:
+        prefetch = 2 * num_workers
+    if prefetch < 1:
+        raise ValueError('prefetch should be a positive integer, found {}'.format(prefetch))
+    items = iter(iterable)
+    pool = _executors[executor](max_workers=num_workers, initializer=initializer, initargs=initargs)
+    try:
+        pending = collections.deque(pool.submit(func, item) for item in itertools.islice(items, prefetch))
+        if ordered:
+            while pending:
+                future = pending.popleft()
+                result = future.result()
+                for item in itertools.islice(items, 1):
+                    pending.append(pool.submit(func, item))
+                yield result
+        else:
+            pending = set(pending)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for item in itertools.islice(items, len(done)):
+                    pending.add(pool.submit(func, item))
+                for future in done:
+                    yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
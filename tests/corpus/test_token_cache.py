@@ -0,0 +1,22 @@
+from src.corpus import documents
+from src.corpus.keywords import build_keyword_processor
+from src.corpus.token_cache import TokenCache
+
+DEFAULT_KEYWORDS = {'climate': ['climate change']}
+CUSTOM_KEYWORDS = {'energy': ['solar power']}
+TEXT = 'Climate change is why we need solar power now.'
+
+
+def test_custom_keywords_are_extracted(tmp_path, monkeypatch):
+    monkeypatch.setattr(documents, 'keywords', DEFAULT_KEYWORDS)
+    monkeypatch.setattr(documents.CorpusDocument, 'keyword_processor', build_keyword_processor(DEFAULT_KEYWORDS))
+    cache_path = str(tmp_path / 'tokens_cache.sqlite')
+    with TokenCache(cache_path=cache_path) as cache:
+        (_, _, default_keywords), = cache.tokenize_many([TEXT])
+    with TokenCache(cache_path=cache_path, keywords=CUSTOM_KEYWORDS) as cache:
+        (tokens, _, custom_keywords), = cache.tokenize_many([TEXT])
+        # hits are the entries extracted with the custom keywords
+        assert cache.tokenize_many([TEXT])[0][2] == custom_keywords
+    assert default_keywords == ['climate']
+    assert custom_keywords == ['energy']
+    assert 'solar' in tokens